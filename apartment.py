@@ -0,0 +1,69 @@
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+
+from config import DESCRIPTION_MAX_LENGTH
+
+
+@dataclass(slots=True)
+class Apartment:
+    """Объявление о квартире: компактная запись со слотами вместо словаря
+
+    Названия станций интернируются (одна строка на станцию на весь процесс), описание
+    обрезается до DESCRIPTION_MAX_LENGTH: комнаты, площадь и метро парсер берет из полного текста.
+    """
+
+    id: str | None
+    title: str
+    price: str
+    price_num: int
+    location: str
+    url: str
+    description: str = ''
+    image_url: str | None = None
+    rooms: int | None = None
+    area: float | None = None
+    metro_stations: tuple = ()
+    metro_time: int | None = None
+    coords: tuple | None = None
+    date_published: float | None = None
+    # Заполняются при отборе и объединении выдачи: поиск, все поиски и чаты подписчиков
+    search: str | None = None
+    searches: list | tuple = ()
+    chat_ids: list | tuple = ()
+
+    def __post_init__(self):
+        self.metro_stations = tuple(sys.intern(station) for station in self.metro_stations)
+        if len(self.description) > DESCRIPTION_MAX_LENGTH:
+            self.description = self.description[:DESCRIPTION_MAX_LENGTH - 1] + '…'
+
+    @property
+    def full_text(self):
+        """Заголовок, описание и адрес одной строкой (поиск станций в тексте)"""
+        return f"{self.title} {self.description} {self.location}"
+
+    def to_db_row(self, apartment_id):
+        """Строка для вставки в таблицу apartments"""
+        date_published = None
+        if self.date_published:
+            try:
+                date_published = datetime.fromtimestamp(self.date_published)
+            except (OverflowError, OSError, ValueError):
+                pass
+
+        return (
+            apartment_id,
+            self.id,
+            self.title,
+            self.price,
+            self.price_num,
+            self.location,
+            self.url,
+            self.image_url,
+            self.description,
+            self.rooms,
+            self.area,
+            ','.join(self.metro_stations),
+            self.metro_time,
+            date_published
+        )
@@ -1,165 +1,135 @@
 import requests
+import hashlib
 import time
 import random
-import re
 import pickle
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
-from bs4 import BeautifulSoup
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import TimeoutException
-import undetected_chromedriver as uc
+from requests.adapters import HTTPAdapter
 from config import (
-    HEADERS, AVITO_SEARCH_URL, TARGET_METRO_STATIONS,
-    FILTER_CRITERIA, PROXY_HOST, PROXY_PORT, PROXY_USER, PROXY_PASS
+    HEADERS, USER_AGENTS, TARGET_METRO_STATIONS, SEARCHES,
+    MAX_CARDS_PER_PAGE, MAX_PAGES, SEEN_CARDS_PER_SEARCH, SCRAPE_MODE
 )
-
+from batch_filter import BatchFilter
+from browser_pool import BrowserPool
+from listing_parser import ListingParser
+from metrics import METRICS
+from proxy_pool import ProxyPool, NoProxyError
 
 
 class AdvancedAvitoScraper:
-    def __init__(self):
+    # Признаки страницы проверки вместо выдачи
+    CHALLENGE_INDICATORS = (
+        'проверка безопасности',
+        'доступ ограничен',
+        'автоматический запрос',
+        'подозрительная активность',
+        'captcha',
+        'http-equiv="refresh"',  # Промежуточная страница-заглушка (см. debug_response.html)
+    )
+
+    # Страница готова к разбору: есть карточки, загрузка завершена или показана проверка
+    PAGE_READY_SCRIPT = """
+        if (document.querySelector('[data-marker="item"]')) return true;
+        if (document.readyState === 'complete') return true;
+        const text = ((document.title || '') + ' ' + (document.body ? document.body.innerText.slice(0, 2000) : ''))
+            .toLowerCase();
+        return ['проверка безопасности', 'доступ ограничен', 'captcha', 'подозрительная активность']
+            .some(indicator => text.includes(indicator));
+    """
+
+    def __init__(self, name=None, proxy_pool=None, browser_pool=None, subscriptions=None):
+        self.name = name
+        # Профили подписчиков: карточку оставляем, если она подходит хотя бы одному из них
+        self.subscriptions = subscriptions
         self.headers = HEADERS.copy()
         self.base_url = "https://www.avito.ru"
         self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=10))
+        self.parser = ListingParser(self.base_url)
+        # ETag / Last-Modified и хеш тела последнего ответа по каждому URL
+        self.page_validators = {}
+        # Валидаторы и карточки текущего прохода: вступают в силу, только когда проход сохранен
+        self.pending_validators = {}
+        self.pending_cards = {}
+        # URL карточек, встреченных в прошлых проходах, по каждому поиску
+        self.seen_card_urls = {}
+        # Векторный фильтр по каждому поиску: (индекс подписок, фильтр), перестраивается с индексом
+        self.batch_filters = {}
+        # Браузер, выданный пулом на время прохода поиска
+        self.browser = None
         self.driver = None
-        self.cookies_file = "avito_cookies.pkl"
-        self.proxy_index = 0
-        self.blocked_proxies = set()
+        self.lock = threading.RLock()
+        # Cookies HTTP-сессии: у каждого воркера свой файл, чтобы сессии не перетирали друг друга
+        self.cookies_file = f"avito_cookies_{name}.pkl" if name else "avito_cookies.pkl"
         self.ip_blocked = False
         self.last_block_time = 0
         self.block_count = 0
-
-        # Прокси список (добавьте рабочие прокси)
-        self.proxies = [
-            # Формат: {'host': 'ip', 'port': 'port', 'username': 'user', 'password': 'pass'}
-            {'host': PROXY_HOST, 'port': PROXY_PORT, 'username': PROXY_USER, 'password': PROXY_PASS},
-        ]
-        self.user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        ]
-
-        print(f"[AdvancedScraper] 🚀 Инициализация с {len(self.proxies)} прокси")
-
-    def setup_driver(self, use_proxy=True):
-        """✅ Исправленная настройка драйвера с авторизованным прокси"""
-        try:
-            options = uc.ChromeOptions()
-
-            # Базовые настройки
-            options.add_argument('--no-sandbox')
-            options.add_argument('--disable-dev-shm-usage')
-            options.add_argument('--disable-blink-features=AutomationControlled')
-            options.add_argument('--disable-extensions')
-
-            # User-Agent
-            user_agent = random.choice(self.user_agents)
-            options.add_argument(f'--user-agent={user_agent}')
-
-            # ✅ Настройка авторизованного прокси для Selenium
-            if use_proxy and self.proxies:
-                proxy = self.get_next_proxy()
-                if proxy:
-                    proxy_url = self.format_proxy_url(proxy)
-                    options.add_argument(f'--proxy-server={proxy_url}')
-                    print(f"[AdvancedScraper] 🌐 Selenium прокси: {proxy['host']}:{proxy['port']}")
-                    self.current_proxy = proxy
-
-            options.add_argument('--window-size=1280,720')
-
-            # Создаем драйвер
-            self.driver = uc.Chrome(options=options)
-
-            # Загружаем cookies
-            self.load_cookies()
-
-            print(f"[AdvancedScraper] ✅ Драйвер настроен с авторизованным прокси")
-            return True
-
-        except Exception as e:
-            print(f"[AdvancedScraper] ❌ Ошибка настройки драйвера: {e}")
-            return False
+        # Запросов страниц за последний проход — для бюджета запросов планировщика
+        self.requests_made = 0
+
+        # Пул прокси общий для всех воркеров, если передан снаружи
+        self.proxy_pool = proxy_pool if proxy_pool is not None else ProxyPool.from_config()
+        # Пул браузеров общий для всех воркеров, если передан снаружи
+        self.owns_browser_pool = browser_pool is None
+        self.browser_pool = browser_pool if browser_pool is not None else BrowserPool(self.proxy_pool, size=1)
+        self.user_agents = USER_AGENTS
+        # HTTP-сессия берет User-Agent браузера, чьи cookies получила, чтобы они оставались валидными
+        self.user_agent = random.choice(self.user_agents)
+        self.headers['User-Agent'] = self.user_agent
+        self.load_session_cookies()
+
+        print(f"[AdvancedScraper] 🚀 Инициализация с {len(self.proxy_pool)} прокси")
 
     def get_next_proxy(self):
-        """Получить следующий прокси с правильным форматом"""
-        if not self.proxies:
-            return None
-
-        available_proxies = [p for p in self.proxies
-                             if f"{p['host']}:{p['port']}" not in self.blocked_proxies]
-
-        if not available_proxies:
-            print("[AdvancedScraper] ⚠️ Все прокси заблокированы, сброс списка")
-            self.blocked_proxies.clear()
-            available_proxies = self.proxies
-
-        return random.choice(available_proxies)
-
-    def format_proxy_url(self, proxy):
-        """Форматирование прокси URL с авторизацией"""
-        if 'username' in proxy and 'password' in proxy:
-            return f"http://{proxy['username']}:{proxy['password']}@{proxy['host']}:{proxy['port']}"
-        else:
-            return f"http://{proxy['host']}:{proxy['port']}"
-
-    def load_cookies(self):
-        """Загрузка сохраненных cookies"""
-        if os.path.exists(self.cookies_file):
-            try:
-                if self.driver.current_url == 'data:,':
-                    self.driver.get("https://www.avito.ru")
-                    time.sleep(2)
-
-                with open(self.cookies_file, 'rb') as f:
-                    cookies = pickle.load(f)
-                    for cookie in cookies:
-                        try:
-                            self.driver.add_cookie(cookie)
-                        except:
-                            continue
-                print(f"[AdvancedScraper] 🍪 Загружено {len(cookies)} cookies")
-            except Exception as e:
-                print(f"[AdvancedScraper] ⚠️ Ошибка загрузки cookies: {e}")
+        """Лучший по оценке здоровья прокси из пула"""
+        return self.proxy_pool.choose()
 
     def save_cookies(self):
-        """Сохранение текущих cookies"""
-        if self.driver:
+        """Сохранение cookies браузера и перенос их в HTTP-сессию"""
+        if self.browser:
             try:
-                cookies = self.driver.get_cookies()
+                cookies = self.browser.save_cookies()
                 with open(self.cookies_file, 'wb') as f:
                     pickle.dump(cookies, f)
                 print(f"[AdvancedScraper] 💾 Сохранено {len(cookies)} cookies")
+
+                # Cookies, полученные браузером после проверки, нужны HTTP-сессии
+                self.apply_session_cookies(cookies)
+                self.user_agent = self.headers['User-Agent'] = self.browser.user_agent
             except Exception as e:
                 print(f"[AdvancedScraper] ❌ Ошибка сохранения cookies: {e}")
 
-    def check_blocking(self):
-        """Проверка на блокировку"""
-        if not self.driver:
-            return False
+    def load_session_cookies(self):
+        """Загрузка сохраненных браузером cookies в HTTP-сессию"""
+        if os.path.exists(self.cookies_file):
+            try:
+                with open(self.cookies_file, 'rb') as f:
+                    self.apply_session_cookies(pickle.load(f))
+            except Exception as e:
+                print(f"[AdvancedScraper] ⚠️ Ошибка загрузки cookies в сессию: {e}")
+
+    def apply_session_cookies(self, cookies):
+        """Перенос cookies в формате Selenium в requests.Session"""
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain'), path=cookie.get('path', '/')
+            )
 
-        page_source = self.driver.page_source.lower()
-
-        blocking_indicators = [
-            'проверка безопасности',
-            'captcha',
-            'доступ ограничен',
-            'заблокирован',
-            'robot',
-            'bot',
-            'автоматический запрос',
-            'подозрительная активность'
-        ]
-
-        for indicator in blocking_indicators:
-            if indicator in page_source:
-                print(f"[AdvancedScraper] 🚫 Обнаружена блокировка: {indicator}")
-                return True
+    def check_blocking(self, page_source):
+        """Проверка снимка страницы и адреса браузера на блокировку"""
+        if self.is_challenge_page(page_source.encode('utf-8')):
+            print("[AdvancedScraper] 🚫 Обнаружена блокировка: страница проверки")
+            return True
 
-        # Проверяем статус страницы
+        # Проверяем адрес страницы
         try:
             current_url = self.driver.current_url
             if 'blocked' in current_url or 'captcha' in current_url:
@@ -169,234 +139,227 @@ class AdvancedAvitoScraper:
 
         return False
 
-    def handle_blocking(self):
-        """Обработка блокировки"""
+    def handle_blocking(self, proxy=None):
+        """Обработка блокировки: proxy — тот, через который шел заблокированный запрос"""
         self.ip_blocked = True
         self.last_block_time = time.time()
         self.block_count += 1
 
         print(f"[AdvancedScraper] 🚫 IP заблокирован (блокировка #{self.block_count})")
+        METRICS.inc('blocks')
 
-        # Закрываем текущий драйвер
-        if self.driver:
-            self.driver.quit()
-            self.driver = None
+        # Браузер с заблокированным прокси пул перезапустит при возврате
+        if self.browser and self.browser.proxy is proxy:
+            self.browser.blocked = True
 
-        # Добавляем текущий прокси в заблокированные
-        if hasattr(self, 'current_proxy'):
-            proxy_string = f"{self.current_proxy['host']}:{self.current_proxy['port']}"
-            self.blocked_proxies.add(proxy_string)
-            print(f"[AdvancedScraper] ❌ Прокси {proxy_string} добавлен в черный список")
+        # Выводим прокси из ротации на время cooldown
+        if proxy:
+            self.proxy_pool.report_block(proxy)
+            print(f"[AdvancedScraper] ❌ Прокси {proxy.key} выведен из ротации")
 
         # Возвращаем информацию о блокировке для уведомления
         return {
             'blocked': True,
             'block_count': self.block_count,
             'timestamp': datetime.now(),
-            'blocked_proxies': len(self.blocked_proxies)
+            'blocked_proxies': self.proxy_pool.open_count()
         }
 
-    def get_apartments(self):
+    def get_apartments(self, search=None, is_known=None):
         """Главный метод получения квартир"""
-        try:
+        search = search or SEARCHES[0]
+
+        with self.lock:
+            self.requests_made = 0
+            self.discard_sweep()
+
             # Проверяем блокировку
             if self.ip_blocked and (time.time() - self.last_block_time) < 1800:  # 30 минут
                 remaining = 1800 - (time.time() - self.last_block_time)
                 print(f"[AdvancedScraper] ⏰ Ждем снятия блокировки: {remaining / 60:.1f} мин")
                 return []
 
-            # Настраиваем драйвер
-            if not self.driver or self.ip_blocked:
-                if not self.setup_driver():
-                    print("[AdvancedScraper] ❌ Не удалось настроить драйвер, используем fallback")
-                    return self.get_apartments_fallback()
-                self.ip_blocked = False
-
-            # Переходим на страницу
-            url = AVITO_SEARCH_URL if AVITO_SEARCH_URL else "https://www.avito.ru/moskva/kvartiry/sdam"
-            print(f"[AdvancedScraper] 🌐 Переход на: {url[:80]}...")
-
-            self.driver.get(url)
-            time.sleep(random.uniform(3, 5))
+            if SCRAPE_MODE == 'browser':
+                return self.get_apartments_browser(search, is_known)
+            return self.get_apartments_http(search, is_known)
 
-            # Проверяем на блокировку
-            if self.check_blocking():
-                return [self.handle_blocking()]
-
-            # ✅ Упрощенное ожидание загрузки
-            try:
-                WebDriverWait(self.driver, 10).until(
-                    lambda driver: len(driver.find_elements(By.CSS_SELECTOR, '[data-marker="item"]')) > 0
-                )
-            except TimeoutException:
-                print("[AdvancedScraper] ⚠️ Таймаут, пробуем парсить что есть")
+    def get_apartments_browser(self, search, is_known=None, http_fallback=True):
+        """Получение квартир через Selenium (браузер берется из пула на время прохода)"""
+        try:
+            self.checkout_browser()
+        except NoProxyError:
+            # Без прокси не идем ни браузером, ни запросами: проход поиска считается неудачным
+            raise
+        except Exception as e:
+            print(f"[AdvancedScraper] ❌ Не удалось получить браузер: {e}")
+            if http_fallback:
+                print("[AdvancedScraper] ❌ Используем requests")
+                return self.get_apartments_http(search, is_known, browser_fallback=False)
+            return []
 
-            # Парсим
-            apartments = self.parse_apartments()
-            self.save_cookies()
+        try:
+            apartments, signal = self.crawl_pages(search, self.load_page, is_known)
+            if signal:
+                return [signal]  # Информация о блокировке для уведомления
+            if not self.browser.blocked:
+                self.ip_blocked = False
+                self.save_cookies()
 
             print(f"[AdvancedScraper] ✅ Найдено квартир: {len(apartments)}")
             return apartments
 
         except Exception as e:
             print(f"[AdvancedScraper] ❌ Ошибка: {e}")
-            return self.get_apartments_fallback()
 
-    def parse_apartments(self):
-        """Парсинг квартир с помощью Selenium"""
-        apartments = []
+        finally:
+            # Браузер возвращается в пул до перехода на requests
+            self.checkin_browser()
 
-        try:
-            # Получаем все карточки объявлений
-            apartment_elements = self.driver.find_elements(By.CSS_SELECTOR, '[data-marker="item"]')
-            print(f"[AdvancedScraper] 🏠 Найдено элементов: {len(apartment_elements)}")
-
-            for i, element in enumerate(apartment_elements[:15]):  # Ограничиваем количество
-                try:
-                    print(f"[AdvancedScraper] 🔍 Обработка элемента {i + 1}")
-
-                    # Заголовок
-                    title_elem = element.find_element(By.CSS_SELECTOR, '[data-marker="item-title"]')
-                    title = title_elem.text.strip() if title_elem else "Без названия"
-
-                    # Ссылка
-                    url = title_elem.get_attribute('href') if title_elem else ""
-
-                    # Цена
-                    try:
-                        price_elem = element.find_element(By.CSS_SELECTOR, '[data-marker="item-price"]')
-                        price = price_elem.text.strip()
-                        price_num = self.extract_price_number(price)
-                    except:
-                        price = "Цена не указана"
-                        price_num = 0
-
-                    # Адрес
-                    try:
-                        address_elem = element.find_element(By.CSS_SELECTOR, '[data-marker="item-address"]')
-                        location = address_elem.text.strip()
-                    except:
-                        location = "Адрес не указан"
-
-                    # Описание
-                    try:
-                        desc_elem = element.find_element(By.CSS_SELECTOR, '[data-marker="item-specific-params"]')
-                        description = desc_elem.text.strip()
-                    except:
-                        description = ""
-
-                    # Извлекаем параметры
-                    rooms, area = self.extract_apartment_params(title, description)
-                    metro_info = self.extract_metro_info(element.text)
-
-                    apartment_data = {
-                        'title': title,
-                        'price': price,
-                        'price_num': price_num,
-                        'location': location,
-                        'metro_info': metro_info,
-                        'url': url,
-                        'description': description,
-                        'rooms': rooms,
-                        'area': area,
-                        'listing_age': "📅 Недавно"
-                    }
-
-                    # Проверяем критерии
-                    if self.meets_criteria(apartment_data):
-                        apartments.append(apartment_data)
-                        print(f"[AdvancedScraper] ✅ Добавлено: {title[:50]}...")
-
-                    # Небольшая задержка между элементами
-                    time.sleep(random.uniform(0.3, 0.8))
-
-                except Exception as e:
-                    print(f"[AdvancedScraper] ⚠️ Ошибка обработки элемента {i + 1}: {e}")
-                    continue
+        if http_fallback:
+            return self.get_apartments_http(search, is_known, browser_fallback=False)
+        return []
 
-        except Exception as e:
-            print(f"[AdvancedScraper] ❌ Ошибка парсинга: {e}")
+    def checkout_browser(self):
+        self.browser = self.browser_pool.checkout()
+        self.driver = self.browser.driver
+        print(f"[AdvancedScraper] 🌐 Selenium прокси: {self.browser.name}")
 
-        return apartments
+    def checkin_browser(self):
+        if self.browser:
+            self.browser_pool.checkin(self.browser)
+        self.browser = None
+        self.driver = None
+
+    def load_page(self, url):
+        """Загрузка страницы через Selenium: HTML или информация о блокировке"""
+        print(f"[AdvancedScraper] 🌐 Переход на: {url[:80]}...")
 
-    def extract_price_number(self, price_text):
-        """Извлечение числового значения цены"""
+        started = time.time()
+        with METRICS.time('fetch', mode='browser'):
+            self.driver.get(url)
+        self.browser.pages += 1
+        # У браузера свой прокси, не тот, что у HTTP-сессии
+        if self.browser.proxy:
+            self.proxy_pool.report_success(self.browser.proxy, time.time() - started)
+
+        # Ждем карточки или страницу проверки вместо фиксированной паузы
         try:
-            numbers = re.findall(r'\d+', price_text.replace(' ', ''))
-            if numbers:
-                return int(''.join(numbers))
-        except:
-            pass
-        return 0
+            with METRICS.time('render_wait'):
+                WebDriverWait(self.driver, 10, poll_frequency=0.25).until(
+                    lambda driver: driver.execute_script(self.PAGE_READY_SCRIPT)
+                )
+        except TimeoutException:
+            print("[AdvancedScraper] ⚠️ Таймаут, пробуем парсить что есть")
 
-    def extract_apartment_params(self, title, description):
-        """Извлечение параметров квартиры"""
-        rooms = None
-        area = None
+        # Один снимок страницы: по нему проверяем блокировку и его же парсим
+        page_source = self.driver.page_source
+        if self.check_blocking(page_source):
+            return self.handle_blocking(self.browser.proxy)
 
-        # Комнаты
-        if 'студия' in title.lower():
-            rooms = 0
-        else:
-            room_match = re.search(r'(\d+)-к', title.lower())
-            if room_match:
-                rooms = int(room_match.group(1))
+        return page_source
 
-        # Площадь
-        area_match = re.search(r'(\d+(?:[.,]\d+)?)\s*м²', (title + ' ' + description))
-        if area_match:
-            area = float(area_match.group(1).replace(',', '.'))
+    def crawl_pages(self, search, load_page, is_known=None):
+        """Обход страниц поиска до страницы из уже известных объявлений или до лимита страниц
 
-        return rooms, area
+        Возвращает (квартиры, сигнал): сигнал — словарь о блокировке или проверке от Avito, иначе None.
+        """
+        apartments = []
+        max_pages = search.get('max_pages', MAX_PAGES)
+        seen_urls = self.seen_card_urls.setdefault(search['name'], OrderedDict())
+
+        for page in range(1, max_pages + 1):
+            if page > 1:
+                time.sleep(random.uniform(1, 3))
+
+            content = load_page(self.page_url(search['url'], page, paginate=max_pages > 1))
+            self.requests_made += 1
+            if isinstance(content, dict):
+                return apartments, content  # Блокировка или проверка от Avito
+            if not content:
+                break
+
+            with METRICS.time('parse'):
+                cards = list(self.parser.parse(content, limit=MAX_CARDS_PER_PAGE))
+            with METRICS.time('filter'):
+                matched = self.select_apartments(cards, search)
+            apartments.extend(matched)
+            METRICS.inc('cards_seen', len(cards), search=search['name'])
+            METRICS.inc('cards_matched', len(matched), search=search['name'])
+
+            if not cards:
+                break
+
+            # Страница целиком из известных объявлений — дальше только старые. Известными карточки
+            # становятся, когда проход сохранен (commit_sweep), иначе потерянные страницы не обойти заново
+            unseen = [card for card in cards if card.url not in seen_urls]
+            self.pending_cards.setdefault(search['name'], []).extend(card.url for card in cards)
+
+            if not unseen or (is_known and is_known(unseen)):
+                print(f"[AdvancedScraper] ⏹️ Страница {page} без новых объявлений, обход остановлен")
+                break
+
+        return apartments, None
+
+    def page_url(self, url, page, paginate=True):
+        """URL страницы выдачи: сортировка по дате и номер страницы"""
+        if not paginate:
+            return url
+
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query))
+        query['s'] = '104'  # По дате — иначе остановка на известных объявлениях некорректна
+        if page > 1:
+            query['p'] = str(page)
+        else:
+            query.pop('p', None)
 
-    def extract_metro_info(self, text):
-        """Извлечение информации о метро"""
-        metro_info = {'stations': [], 'time': None}
-        text_lower = text.lower()
+        return urlunsplit(parts._replace(query=urlencode(query)))
 
-        # Время до метро
-        time_match = re.search(r'(\d+)\s*мин', text_lower)
-        if time_match:
-            metro_info['time'] = int(time_match.group(1))
+    def batch_filter(self, search):
+        """Фильтр по профилям подписчиков поиска; без подписчиков — по фильтру самого поиска"""
+        index = self.subscriptions.index if self.subscriptions else None
+        cached = self.batch_filters.get(search['name'])
+        if cached is None or cached[0] is not index:
+            profiles = self.subscriptions.profiles(search['name']) if index is not None else []
+            cached = self.batch_filters[search['name']] = (index, BatchFilter(profiles or [search['filter']]))
+        return cached[1]
 
-        # Станции метро
-        for station in TARGET_METRO_STATIONS:
-            if station in text_lower:
-                metro_info['stations'].append(station)
+    def select_apartments(self, cards, search):
+        """Отбор карточек, подходящих хотя бы одному профилю (кому отправить, решает индекс подписок)"""
+        apartments = []
+        matched = self.batch_filter(search).match(cards).any(axis=0)
 
-        return metro_info
+        for apartment, ok in zip(cards, matched):
+            if not ok:
+                continue
+            apartment.search = search['name']
+            apartments.append(apartment)
+            print(f"[AdvancedScraper] ✅ Добавлено: {apartment.title[:50]}...")
 
-    def meets_criteria(self, apartment_data):
-        """Проверка критериев"""
+        return apartments
+
+    def meets_criteria(self, apartment, criteria=None):
+        """Проверка критериев одной карточки (поштучный эталон для BatchFilter)"""
+        criteria = criteria or SEARCHES[0]['filter']
         try:
             # Цена
-            if apartment_data.get('price_num') and apartment_data['price_num'] > FILTER_CRITERIA['max_price']:
+            if apartment.price_num and apartment.price_num > criteria['max_price']:
                 return False
 
             # Площадь
-            if apartment_data.get('area') and apartment_data['area'] < FILTER_CRITERIA['min_area']:
+            if apartment.area and apartment.area < criteria['min_area']:
                 return False
 
             # Комнаты
-            if apartment_data.get('rooms') and apartment_data['rooms'] not in FILTER_CRITERIA['rooms']:
+            if apartment.rooms and apartment.rooms not in criteria['rooms']:
                 return False
 
             # Время до метро
-            metro_time = apartment_data['metro_info'].get('time')
-            if metro_time and metro_time > FILTER_CRITERIA['max_metro_time']:
+            if apartment.metro_time and apartment.metro_time > criteria['max_metro_time']:
                 return False
 
-            # Станции метро
-            metro_stations = apartment_data['metro_info'].get('stations', [])
-            if metro_stations:
-                return any(station in TARGET_METRO_STATIONS for station in metro_stations)
-
-            # Поиск в тексте
-            full_text = (apartment_data.get('title', '') + ' ' +
-                         apartment_data.get('description', '') + ' ' +
-                         apartment_data.get('location', '')).lower()
-
-            return any(station in full_text for station in TARGET_METRO_STATIONS)
+            # Станции метро: парсер уже нашел их в тексте карточки, повторно текст не сканируем
+            return any(station in TARGET_METRO_STATIONS for station in apartment.metro_stations)
 
         except Exception as e:
             print(f"[AdvancedScraper] ❌ Ошибка проверки критериев: {e}")
@@ -404,99 +367,135 @@ class AdvancedAvitoScraper:
 
     def cleanup(self):
         """Очистка ресурсов"""
-        if self.driver:
-            self.save_cookies()
-            self.driver.quit()
-            print("[AdvancedScraper] 🧹 Ресурсы очищены")
+        self.session.close()
+        if self.owns_browser_pool:
+            self.browser_pool.close()
+        print("[AdvancedScraper] 🧹 Ресурсы очищены")
 
-    def get_apartments_fallback(self):
-        """Fallback на requests с авторизованным прокси"""
-        print("[AdvancedScraper] 🔄 Fallback на requests с авторизацией...")
+    def get_apartments_http(self, search, is_known=None, browser_fallback=True):
+        """Получение квартир через requests с авторизованным прокси"""
+        print("[AdvancedScraper] ⚡ Запрос через requests с авторизацией...")
 
         try:
-            url = AVITO_SEARCH_URL if AVITO_SEARCH_URL else "https://www.avito.ru/moskva/kvartiry/sdam"
-
             # ✅ Настройка авторизованного прокси для requests
-            proxies_dict = None
-            if self.proxies:
-                proxy = self.get_next_proxy()
-                if proxy:
-                    proxy_url = self.format_proxy_url(proxy)
-                    proxies_dict = {
-                        'http': proxy_url,
-                        'https': proxy_url
-                    }
-                    print(
-                        f"[AdvancedScraper] 🌐 Requests прокси: {proxy['username']}:***@{proxy['host']}:{proxy['port']}")
-
-            # Делаем запрос
-            response = self.session.get(
-                url,
-                headers=self.headers,
-                proxies=proxies_dict,
-                timeout=15
-            )
-
-            if response.status_code == 429:
-                return [self.handle_blocking()]
-
-            if response.status_code != 200:
-                print(f"[AdvancedScraper] ❌ HTTP {response.status_code}")
-                return []
+            proxy = self.get_next_proxy()
+            if proxy:
+                print(f"[AdvancedScraper] 🌐 Requests прокси: {proxy.username or '-'}:***@{proxy.key}")
 
-            # Парсим через BeautifulSoup
-            soup = BeautifulSoup(response.content, 'html.parser')
-            cards = soup.find_all('div', {'data-marker': 'item'})
+            apartments, signal = self.crawl_pages(
+                search, lambda url: self.fetch_page(url, proxy), is_known
+            )
 
-            apartments = []
-            for card in cards[:5]:
-                try:
-                    apartment_data = self.parse_card_with_bs4(card)
-                    if apartment_data and self.meets_criteria(apartment_data):
-                        apartments.append(apartment_data)
-                except:
-                    continue
+            # Страница проверки: браузер проходит ее и делится cookies с сессией
+            if signal and signal.get('challenge'):
+                METRICS.inc('challenges')
+                if browser_fallback:
+                    print("[AdvancedScraper] 🧩 Проверка от Avito, переключаемся на браузер")
+                    return self.get_apartments_browser(search, is_known, http_fallback=False)
+                return [self.handle_blocking(proxy)]
 
-            print(f"[AdvancedScraper] 📊 Fallback результат: {len(apartments)} квартир")
+            print(f"[AdvancedScraper] 📊 Результат requests: {len(apartments)} квартир")
             return apartments
 
+        except NoProxyError:
+            raise
         except Exception as e:
-            print(f"[AdvancedScraper] ❌ Fallback ошибка: {e}")
+            print(f"[AdvancedScraper] ❌ Ошибка requests: {e}")
+            if browser_fallback:
+                return self.get_apartments_browser(search, is_known, http_fallback=False)
             return []
 
-    def parse_card_with_bs4(self, card):
-        """Парсинг карточки через BeautifulSoup"""
+    def fetch_page(self, url, proxy=None):
+        """Загрузка страницы через requests: HTML, признак проверки/блокировки или None"""
+        headers = self.headers
+        validators = self.page_validators.get(url, {})
+
+        # Условный запрос: при неизменной странице сервер вернет 304 без тела
+        if validators.get('etag') or validators.get('last_modified'):
+            headers = headers.copy()
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        proxies_dict = {'http': proxy.url, 'https': proxy.url} if proxy else None
         try:
-            title_elem = card.find('a', {'data-marker': 'item-title'})
-            title = title_elem.text.strip() if title_elem else "Без названия"
-
-            price_elem = card.find('span', {'data-marker': 'item-price'})
-            price = price_elem.text.strip() if price_elem else "Цена не указана"
-            price_num = self.extract_price_number(price)
-
-            address_elem = card.find('div', {'data-marker': 'item-address'})
-            location = address_elem.text.strip() if address_elem else "Адрес не указан"
-
-            url = title_elem.get('href', '') if title_elem else ''
-            if url and not url.startswith('http'):
-                url = self.base_url + url
-
-            description = card.get_text()
-            rooms, area = self.extract_apartment_params(title, description)
-            metro_info = self.extract_metro_info(description)
-
-            return {
-                'title': title,
-                'price': price,
-                'price_num': price_num,
-                'location': location,
-                'metro_info': metro_info,
-                'url': url,
-                'description': description,
-                'rooms': rooms,
-                'area': area,
-                'listing_age': "📅 Недавно"
-            }
-        except Exception as e:
-            print(f"[AdvancedScraper] ❌ BS4 парсинг: {e}")
+            with METRICS.time('fetch', mode='http'):
+                response = self.session.get(
+                    url,
+                    headers=headers,
+                    proxies=proxies_dict,
+                    timeout=15
+                )
+        except requests.RequestException:
+            if proxy:
+                self.proxy_pool.report_failure(proxy)
+            raise
+
+        if proxy:
+            if response.status_code in (403, 429):
+                self.proxy_pool.report_failure(proxy)
+            else:
+                self.proxy_pool.report_success(proxy, response.elapsed.total_seconds())
+
+        METRICS.inc('bytes_fetched', len(response.content))
+
+        if response.status_code == 304:
+            print("[AdvancedScraper] 💤 Страница не изменилась (304)")
             return None
+
+        if response.status_code in (403, 429):
+            return {'challenge': True, 'status': response.status_code}
+
+        if response.status_code != 200:
+            print(f"[AdvancedScraper] ❌ HTTP {response.status_code}")
+            return None
+
+        content = response.content
+        if self.is_challenge_page(content):
+            return {'challenge': True, 'status': response.status_code}
+
+        body_hash = hashlib.sha1(content).hexdigest()
+        unchanged = body_hash == validators.get('body_hash')
+        self.pending_validators[url] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'body_hash': body_hash,
+        }
+
+        # Тот же ответ, что и в прошлый раз — разбор и запросы к базе не нужны
+        if unchanged:
+            print("[AdvancedScraper] 💤 Страница не изменилась (тот же хеш)")
+            return None
+
+        return content
+
+    def commit_sweep(self):
+        """Проход обработан и сохранен: следующие запросы могут быть условными, карточки — известными
+
+        Возвращает {поиск: URL встреченных карточек}, чтобы вызывающий сохранил их в базе.
+        """
+        self.page_validators.update(self.pending_validators)
+        pending_cards = self.pending_cards
+        for search_name, urls in pending_cards.items():
+            seen_urls = self.seen_card_urls.setdefault(search_name, OrderedDict())
+            for url in urls:
+                seen_urls[url] = True
+                seen_urls.move_to_end(url)
+            while len(seen_urls) > SEEN_CARDS_PER_SEARCH:
+                seen_urls.popitem(last=False)
+        self.discard_sweep()
+        return pending_cards
+
+    def discard_sweep(self):
+        """Проход не сохранен: страницы должны загрузиться заново, иначе 304 и остановка обхода скроют объявления"""
+        self.pending_validators = {}
+        self.pending_cards = {}
+
+    def is_challenge_page(self, content):
+        """Страница без карточек с признаками капчи или проверки"""
+        if b'data-marker="item"' in content or b'data-mfe-state' in content:
+            return False
+
+        text = content.decode('utf-8', errors='ignore').lower()
+        return any(indicator in text for indicator in self.CHALLENGE_INDICATORS)
@@ -0,0 +1,128 @@
+from collections import namedtuple
+
+import numpy as np
+
+from config import TARGET_METRO_STATIONS
+from metro import StationMatcher
+
+# Выдача в столбцах: один проход по карточкам на все профили
+CardColumns = namedtuple('CardColumns', ['valid', 'price', 'area', 'rooms', 'metro_time', 'stations', 'unresolved'])
+
+
+class BatchFilter:
+    """Проверка выдачи сразу по многим профилям фильтров векторными операциями NumPy
+
+    Правила те же, что в AdvancedAvitoScraper.meets_criteria: отсутствующие (и нулевые)
+    цена, площадь, комнаты и время до метро фильтр не отсекают; станции из карточки
+    сверяются со списком профиля. Парсер ищет в тексте только целевые станции, поэтому
+    у карточки без них станции профиля ищутся в заголовке, описании и адресе.
+    """
+
+    def __init__(self, profiles, stations=TARGET_METRO_STATIONS):
+        self.profiles = list(profiles)
+        self.default_stations = set(stations)
+
+        # Словарь станций всех профилей — столбцы матрицы 0/1 «карточка × станция»
+        # (float32, чтобы пересечение считалось матричным произведением через BLAS)
+        profile_stations = [set(profile.get('stations') or self.default_stations) for profile in self.profiles]
+        self.station_names = sorted(self.default_stations.union(*profile_stations))
+        self.station_index = {station: i for i, station in enumerate(self.station_names)}
+        self.matcher = StationMatcher(self.station_names)
+
+        self.max_price = np.array([profile.get('max_price', np.inf) for profile in self.profiles], dtype=float)
+        self.min_area = np.array([profile.get('min_area', 0) for profile in self.profiles], dtype=float)
+        self.max_metro_time = np.array([profile.get('max_metro_time', np.inf) for profile in self.profiles],
+                                       dtype=float)
+        self.rooms = [profile.get('rooms') for profile in self.profiles]
+
+        self.profile_stations = np.zeros((len(self.profiles), len(self.station_names)), dtype=np.float32)
+        for row, names in enumerate(profile_stations):
+            self.profile_stations[row, [self.station_index[station] for station in names]] = 1
+
+    def columns(self, apartments):
+        """Столбцы выдачи; пропуски и нули — NaN, чтобы сравнения их не отсекали"""
+        nan = float('nan')
+        count = len(apartments)
+        valid = [True] * count
+        price = [nan] * count
+        area = [nan] * count
+        rooms = [0] * count
+        metro_time = [nan] * count
+        # Номера ячеек (карточка, станция) для станций из карточки
+        station_rows = []
+        station_columns = []
+        # Карточки без станций: ищем станции в тексте, только если карточка прошла остальные условия
+        unresolved = {}
+
+        for i, apartment in enumerate(apartments):
+            try:
+                price[i] = apartment.price_num or nan
+                area[i] = apartment.area or nan
+                rooms[i] = apartment.rooms or 0
+                metro_time[i] = apartment.metro_time or nan
+
+                if apartment.metro_stations:
+                    found = [self.station_index[station] for station in apartment.metro_stations
+                             if station in self.station_index]
+                    station_rows.extend([i] * len(found))
+                    station_columns.extend(found)
+                else:
+                    unresolved[i] = apartment
+            except Exception:
+                # Как и в meets_criteria: карточку с битыми полями не пропускаем
+                valid[i] = False
+
+        stations = np.zeros((count, len(self.station_names)), dtype=np.float32)
+        stations[station_rows, station_columns] = 1
+        return CardColumns(np.array(valid, dtype=bool), np.array(price, dtype=float), np.array(area, dtype=float),
+                           np.array(rooms, dtype=np.int64), np.array(metro_time, dtype=float), stations, unresolved)
+
+    def resolve_texts(self, columns, candidates):
+        """Поиск станций в тексте для карточек-кандидатов; результат остается в столбцах"""
+        for i in np.flatnonzero(candidates):
+            apartment = columns.unresolved.pop(int(i), None)
+            if apartment is not None:
+                for match in self.matcher.finditer(apartment.full_text):
+                    columns.stations[i, self.station_index[match.station]] = 1
+
+    def rooms_allowed(self, max_rooms):
+        """Таблица «профиль × число комнат»: подходит ли значение"""
+        allowed = np.zeros((len(self.profiles), max_rooms + 1), dtype=bool)
+        for row, rooms in enumerate(self.rooms):
+            if rooms is None:
+                allowed[row] = True
+                continue
+            allowed[row, [value for value in rooms if 0 <= value <= max_rooms]] = True
+        # 0 — студия или число комнат не распознано: не отсекаем
+        allowed[:, 0] = True
+        return allowed
+
+    def match(self, apartments):
+        """Матрица совпадений (профили × карточки); принимает карточки или готовые столбцы"""
+        columns = apartments if isinstance(apartments, CardColumns) else self.columns(apartments)
+        count = len(columns.valid)
+        if not self.profiles or not count:
+            return np.zeros((len(self.profiles), count), dtype=bool)
+
+        # Сравнение с NaN ложно, поэтому пропуски проходят
+        price_ok = ~(columns.price[None, :] > self.max_price[:, None])
+        area_ok = ~(columns.area[None, :] < self.min_area[:, None])
+        time_ok = ~(columns.metro_time[None, :] > self.max_metro_time[:, None])
+
+        rooms = np.clip(columns.rooms, 0, None)
+        rooms_ok = self.rooms_allowed(int(rooms.max()))[:, rooms]
+        matched = price_ok & area_ok & time_ok & rooms_ok & columns.valid[None, :]
+
+        # Регулярное выражение по тексту — самая дорогая часть, поэтому только для прошедших
+        if columns.unresolved:
+            self.resolve_texts(columns, matched.any(axis=0))
+
+        # Пересечение станций профиля и карточки — одно матричное произведение
+        station_ok = (self.profile_stations @ columns.stations.T) > 0
+
+        return matched & station_ok
+
+    def select(self, apartments, profile=0):
+        """Карточки, подходящие под один профиль"""
+        mask = self.match(apartments)[profile]
+        return [apartment for apartment, ok in zip(apartments, mask) if ok]
@@ -0,0 +1,309 @@
+"""Офлайн-бенчмарк горячих путей: разбор выдачи, фильтрация, дедупликация, форматирование.
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_hot_paths.py                       # 10 / 1k / 100k карточек
+    python benchmarks/bench_hot_paths.py --sizes 10,1000 --corpus pages/
+    python benchmarks/bench_hot_paths.py --save baseline.json
+    python benchmarks/bench_hot_paths.py --baseline baseline.json --tolerance 0.25
+
+Сеть не используется: страницы берутся из --corpus (сохраненные *.html выдачи)
+или генерируются синтетически в разметке Avito (data-marker и встроенный JSON).
+"""
+import argparse
+import gc
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from itertools import chain, cycle, islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TARGET_METRO_STATIONS, FILTER_CRITERIA  # noqa: E402
+from listing_parser import ListingParser  # noqa: E402
+from database import ApartmentDB  # noqa: E402
+from avito_scraper import AdvancedAvitoScraper  # noqa: E402
+from batch_filter import BatchFilter  # noqa: E402
+from telegram_bot import TelegramBot  # noqa: E402
+
+CARDS_PER_PAGE = 50
+PROFILE_COUNT = 50
+OTHER_STATIONS = ['Митино', 'Алтуфьево', 'Бибирево', 'Выхино', 'Медведково', 'Жулебино']
+REPAIRS = ['евроремонт', 'косметический ремонт', 'дизайнерский ремонт', 'без ремонта', 'хороший ремонт']
+STREETS = ['ул. Тверская', 'Ленинский пр-т', 'ул. Большая Полянка', 'Кутузовский пр-т', 'ул. Бауманская']
+
+
+def synthetic_listing(i, rng):
+    """Поля одного объявления"""
+    rooms = rng.choice([0, 1, 1, 2, 2, 3])
+    area = round(rng.uniform(18, 90), 1)
+    station = rng.choice(sorted(TARGET_METRO_STATIONS) + OTHER_STATIONS).title()
+    title = f"Студия, {area} м², {rng.randint(1, 20)}/22 эт." if rooms == 0 else \
+        f"{rooms}-к. квартира, {area} м², {rng.randint(1, 20)}/22 эт."
+    description = (f"Сдается квартира, {rng.choice(REPAIRS)}. Рядом метро {station}. "
+                   + "Вся техника, мебель, чистый подъезд. " * rng.randint(1, 12))
+    return {
+        'id': str(1000000000 + i),
+        'title': title,
+        'price': rng.randrange(35000, 150000, 500),
+        'address': f"{rng.choice(STREETS)}, {rng.randint(1, 120)}",
+        'station': station,
+        'minutes': rng.randint(2, 25),
+        'description': description,
+    }
+
+
+def dom_card(listing):
+    return f"""
+<div data-marker="item" data-item-id="{listing['id']}">
+  <a data-marker="item-title" href="/moskva/kvartiry/{listing['id']}"><h3>{listing['title']}</h3></a>
+  <span data-marker="item-price"><meta itemprop="price" content="{listing['price']}"/>{listing['price']:,} ₽ в месяц</span>
+  <div data-marker="item-address"><span>{listing['address']}</span>
+    <span>{listing['station']}</span><span>{listing['minutes']} мин.</span></div>
+  <meta itemprop="description" content="{listing['description']}"/>
+  <img src="https://img.avito.st/image/1/{listing['id']}.jpg"/>
+</div>"""
+
+
+def state_item(listing):
+    return {
+        'id': int(listing['id']),
+        'urlPath': f"/moskva/kvartiry/{listing['id']}",
+        'title': listing['title'],
+        'description': listing['description'],
+        'priceDetailed': {'value': listing['price'], 'fullString': f"{listing['price']:,} ₽ в месяц"},
+        'geo': {
+            'formattedAddress': listing['address'],
+            'geoReferences': [{'content': listing['station'], 'after': f"{listing['minutes']} мин."}],
+        },
+        'images': [{'208x156': f"https://img.avito.st/208/{listing['id']}.jpg",
+                    '636x476': f"https://img.avito.st/636/{listing['id']}.jpg"}],
+        'sortTimeStamp': 1700000000000,
+    }
+
+
+def synthetic_pages(card_count, source, seed=42):
+    """Страницы выдачи по CARDS_PER_PAGE карточек: DOM, встроенный JSON или вперемешку"""
+    rng = random.Random(seed)
+    pages = []
+    for start in range(0, card_count, CARDS_PER_PAGE):
+        listings = [synthetic_listing(i, rng) for i in range(start, min(start + CARDS_PER_PAGE, card_count))]
+        variant = source if source != 'both' else ('dom', 'state')[len(pages) % 2]
+        cards = ''.join(dom_card(listing) for listing in listings)
+        state = ''
+        if variant == 'state':
+            payload = json.dumps({'data': {'catalog': {'items': [state_item(item) for item in listings]}}},
+                                 ensure_ascii=False)
+            state = f'<script type="mime/invalid" data-mfe-state="true">{payload}</script>'
+        pages.append(f"<html><head><meta charset='utf-8'></head><body>{state}{cards}</body></html>".encode())
+    return pages
+
+
+def synthetic_profiles(count, seed=7):
+    """Профили фильтров разных пользователей"""
+    rng = random.Random(seed)
+    return [{
+        **FILTER_CRITERIA,
+        'max_price': rng.randrange(50000, 150000, 5000),
+        'min_area': rng.choice([0, 20, 30, 40]),
+        'rooms': rng.choice([[1], [1, 2], [2, 3], [1, 2, 3]]),
+        'max_metro_time': rng.choice([10, 15, 20, 30]),
+    } for _ in range(count)]
+
+
+def load_corpus(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    return pages
+
+
+def measure(func, memory):
+    """Время выполнения и (во втором прогоне) пик выделенной памяти"""
+    gc.collect()
+    started = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - started
+
+    peak_kb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        func()
+        peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+    return seconds, peak_kb
+
+
+class HotPathBenchmark:
+    """Набор замеров для одного размера выборки"""
+
+    def __init__(self, size, pages, memory=True, per_card_limit=10000):
+        self.size = size
+        self.memory = memory
+        self.per_card_limit = per_card_limit
+        self.parser = ListingParser()
+        self.pages = pages
+        # meets_criteria и форматирование не трогают сеть и браузер — конструктор не нужен
+        self.scraper = object.__new__(AdvancedAvitoScraper)
+        self.bot = TelegramBot()
+
+        self.apartments = self.parse_cards()
+        self.results = []
+
+    def parse_cards(self):
+        """Ровно size карточек: страницы корпуса повторяются по кругу"""
+        cards = []
+        for page in cycle(self.pages):
+            cards.extend(self.parser.parse(page))
+            if len(cards) >= self.size or not cards:
+                break
+        if not cards:
+            raise SystemExit("В корпусе нет карточек объявлений")
+        cards = list(islice(cycle(cards), self.size))
+        # Уникальные ключи, чтобы дедупликация работала как на реальном потоке
+        return [replace(card, id=f"{card.id}-{i}", url=f"{card.url}?n={i}") for i, card in enumerate(cards)]
+
+    def add(self, name, func, items=None):
+        items = items or self.size
+        seconds, peak_kb = measure(func, self.memory)
+        self.results.append({
+            'name': name,
+            'size': self.size,
+            'seconds': seconds,
+            'us_per_card': seconds / items * 1e6,
+            'peak_kb': peak_kb,
+        })
+
+    def run(self):
+        apartments = self.apartments
+        page_count = max(1, -(-self.size // CARDS_PER_PAGE))
+        pages = list(islice(cycle(self.pages), page_count))
+
+        def parse_pages():
+            remaining = self.size
+            for page in pages:
+                for _ in islice(self.parser.parse(page), remaining):
+                    remaining -= 1
+
+        self.add('ListingParser.parse', parse_pages)
+        # Пик памяти здесь — сколько занимает вся выдача, удерживаемая в списке
+        self.add('ListingParser.parse (в памяти)', lambda: list(
+            islice(chain.from_iterable(self.parser.parse(page) for page in pages), self.size)
+        ))
+        self.add('extract_apartment_params', lambda: [
+            self.parser.extract_apartment_params(apartment.title, apartment.description)
+            for apartment in apartments
+        ])
+        self.add('extract_metro_info', lambda: [
+            self.parser.extract_metro_info(apartment.full_text)
+            for apartment in apartments
+        ])
+        self.add('meets_criteria', lambda: [
+            self.scraper.meets_criteria(apartment, FILTER_CRITERIA) for apartment in apartments
+        ])
+        # Векторный фильтр: один профиль и PROFILE_COUNT профилей за один проход
+        single = BatchFilter([FILTER_CRITERIA])
+        self.add('BatchFilter.match', lambda: single.match(apartments))
+        many = BatchFilter(synthetic_profiles(PROFILE_COUNT))
+        self.add(f'BatchFilter.match x{PROFILE_COUNT}', lambda: many.match(apartments))
+        # Готовые столбцы (станции в тексте уже найдены): чистая стоимость матрицы совпадений
+        columns = many.columns(apartments)
+        many.match(columns)
+        self.add(f'BatchFilter.match x{PROFILE_COUNT} (столбцы)', lambda: many.match(columns))
+        self.add('format_apartment_message', lambda: [
+            self.bot.format_apartment_message(apartment) for apartment in apartments
+        ])
+        self.bench_database()
+        return self.results
+
+    def bench_database(self):
+        apartments = self.apartments
+        with tempfile.TemporaryDirectory() as directory:
+            db = ApartmentDB(os.path.join(directory, 'bench.db'))
+            half = apartments[:len(apartments) // 2]
+
+            # Пакетный путь: половина выдачи уже в базе, половина новая
+            db.add_apartments(half)
+            self.add('ApartmentDB.filter_new', lambda: db.filter_new(apartments))
+            self.add('ApartmentDB.add_apartments', lambda: db.add_apartments(apartments))
+
+            # Поштучный путь на больших выборках слишком долог — ограничиваем
+            if self.size <= self.per_card_limit:
+                self.add('ApartmentDB.is_new_apartment', lambda: [
+                    db.is_new_apartment(apartment) for apartment in apartments
+                ])
+                fresh = [replace(apartment, id=f"{apartment.id}-x", url=apartment.url + '-x')
+                         for apartment in apartments]
+                self.add('ApartmentDB.add_apartment', lambda: [db.add_apartment(apartment) for apartment in fresh])
+            db.close()
+
+
+def print_results(results):
+    print(f"\n{'Замер':32} {'Карточек':>9} {'Всего, с':>10} {'мкс/карт.':>10} {'Пик, КБ':>10}")
+    for result in results:
+        peak = f"{result['peak_kb']:.0f}" if result['peak_kb'] is not None else '-'
+        print(f"{result['name']:32} {result['size']:>9} {result['seconds']:>10.3f} "
+              f"{result['us_per_card']:>10.1f} {peak:>10}")
+
+
+def compare(results, baseline_file, tolerance):
+    """Замеры медленнее базовых больше чем на tolerance"""
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline = {(item['name'], item['size']): item for item in json.load(f)}
+
+    regressions = []
+    for result in results:
+        base = baseline.get((result['name'], result['size']))
+        if base and result['us_per_card'] > base['us_per_card'] * (1 + tolerance):
+            regressions.append((result, base))
+
+    for result, base in regressions:
+        print(f"⚠️ Регрессия: {result['name']} ({result['size']}): "
+              f"{base['us_per_card']:.1f} -> {result['us_per_card']:.1f} мкс/карт.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,1000,100000', help='Размеры выборок через запятую')
+    parser.add_argument('--corpus', help='Каталог с сохраненными страницами выдачи (*.html)')
+    parser.add_argument('--source', choices=('dom', 'state', 'both'), default='both',
+                        help='Разметка синтетических страниц')
+    parser.add_argument('--no-memory', action='store_true', help='Без замера памяти (tracemalloc)')
+    parser.add_argument('--per-card-limit', type=int, default=10000,
+                        help='Максимальный размер для поштучных операций с базой')
+    parser.add_argument('--save', help='Сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='Сравнить с сохраненными результатами')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимое замедление (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    corpus = load_corpus(args.corpus) if args.corpus else None
+
+    results = []
+    for size in sizes:
+        pages = corpus or synthetic_pages(size, args.source)
+        print(f"▶️ {size} карточек ({len(pages)} стр.)...")
+        results.extend(HotPathBenchmark(size, pages, not args.no_memory, args.per_card_limit).run())
+
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
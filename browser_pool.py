@@ -0,0 +1,315 @@
+import os
+import pickle
+import random
+import threading
+import time
+
+import undetected_chromedriver as uc
+
+from config import (
+    USER_AGENTS, BROWSER_POOL_SIZE, BROWSER_MAX_PAGES, BROWSER_MAX_RSS_MB, BROWSER_IDLE_TIMEOUT,
+    BROWSER_BLOCK_ASSETS, SCRAPE_MODE
+)
+
+
+def process_tree_rss(pid):
+    """Суммарный RSS процесса и его потомков в МБ (по /proc, только Linux)"""
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total_kb / 1024
+
+
+class BrowserContext:
+    """Запущенный Chrome, закрепленный за одним прокси, со своим файлом cookies"""
+
+    def __init__(self, driver, proxy, user_agent, cookies_file):
+        self.driver = driver
+        self.proxy = proxy
+        self.user_agent = user_agent
+        self.cookies_file = cookies_file
+        self.pages = 0
+        self.blocked = False
+        self.started_at = time.time()
+        self.last_used = self.started_at
+
+    @property
+    def pid(self):
+        return getattr(self.driver, 'browser_pid', None)
+
+    def rss_mb(self):
+        return process_tree_rss(self.pid) if self.pid else 0
+
+    def load_cookies(self):
+        """Прогрев: заход на главную и загрузка cookies этого прокси"""
+        if not os.path.exists(self.cookies_file):
+            return
+        try:
+            self.driver.get("https://www.avito.ru")
+            time.sleep(2)
+
+            with open(self.cookies_file, 'rb') as f:
+                cookies = pickle.load(f)
+                for cookie in cookies:
+                    try:
+                        self.driver.add_cookie(cookie)
+                    except Exception:
+                        continue
+            print(f"[BrowserPool] 🍪 Загружено {len(cookies)} cookies для {self.name}")
+        except Exception as e:
+            print(f"[BrowserPool] ⚠️ Ошибка загрузки cookies: {e}")
+
+    def save_cookies(self):
+        """Сохранение cookies контекста; возвращает их для переноса в HTTP-сессию"""
+        cookies = self.driver.get_cookies()
+        with open(self.cookies_file, 'wb') as f:
+            pickle.dump(cookies, f)
+        return cookies
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            print(f"[BrowserPool] ⚠️ Ошибка остановки браузера: {e}")
+
+    @property
+    def name(self):
+        return self.proxy.key if self.proxy else 'без прокси'
+
+
+class BrowserPool:
+    """Пул прогретых браузеров: выдача на проход поиска и перезапуск по износу"""
+
+    # Настройки профиля Chrome: 2 — запретить загрузку
+    LEAN_PREFS = {
+        'profile.managed_default_content_settings.images': 2,
+        'profile.managed_default_content_settings.media_stream': 2,
+        'profile.default_content_setting_values.notifications': 2,
+        'profile.default_content_setting_values.geolocation': 2,
+    }
+
+    # Шаблоны для Network.setBlockedURLs: шрифты, медиа и рекламные/аналитические хосты
+    BLOCKED_URLS = [
+        '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+        '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+        '*.mp4', '*.webm', '*.mp3',
+        '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*googlesyndication.com*',
+        '*mc.yandex.ru*', '*an.yandex.ru*', '*yandex.ru/ads*', '*adfox.ru*', '*ads.adfox.ru*',
+        '*top-fwz1.mail.ru*', '*ad.mail.ru*', '*vk.com/rtrg*', '*criteo.com*', '*criteo.net*',
+        '*tiktok.com*', '*facebook.net*', '*hotjar.com*',
+    ]
+
+    def __init__(self, proxy_pool, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES,
+                 max_rss_mb=BROWSER_MAX_RSS_MB, idle_timeout=BROWSER_IDLE_TIMEOUT,
+                 block_assets=BROWSER_BLOCK_ASSETS, keep_warm=SCRAPE_MODE == 'browser'):
+        self.proxy_pool = proxy_pool
+        self.block_assets = block_assets
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.idle_timeout = idle_timeout
+        # Замену остановленному браузеру прогреваем, только если браузер — основной режим;
+        # в режиме http он нужен лишь изредка для проверки и запустится по требованию
+        self.keep_warm = keep_warm
+
+        self.idle = []
+        self.busy = set()
+        self.starting = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.started = 0
+        self.recycled = 0
+
+    def __len__(self):
+        with self.condition:
+            return len(self.idle) + len(self.busy) + self.starting
+
+    def create_context(self):
+        """Запуск Chrome с прокси из пула и прогрев cookies"""
+        proxy = self.proxy_pool.choose()
+        user_agent = random.choice(USER_AGENTS)
+
+        options = uc.ChromeOptions()
+
+        # Базовые настройки
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--disable-blink-features=AutomationControlled')
+        options.add_argument('--disable-extensions')
+        options.add_argument(f'--user-agent={user_agent}')
+        options.add_argument('--window-size=1280,720')
+
+        if self.block_assets:
+            # Не ждем картинок и сторонних скриптов: карточки есть в HTML уже к DOMContentLoaded
+            options.page_load_strategy = 'eager'
+            options.add_experimental_option('prefs', self.LEAN_PREFS)
+            options.add_argument('--blink-settings=imagesEnabled=false')
+
+        if proxy:
+            options.add_argument(f'--proxy-server={proxy.url}')
+
+        # Cookies привязаны к IP, поэтому у каждого прокси свой файл
+        cookies_file = f"avito_cookies_{proxy.host}_{proxy.port}.pkl" if proxy else "avito_cookies.pkl"
+
+        driver = uc.Chrome(options=options)
+        if self.block_assets:
+            self.block_urls(driver)
+
+        context = BrowserContext(driver, proxy, user_agent, cookies_file)
+        context.load_cookies()
+        self.started += 1
+        print(f"[BrowserPool] ✅ Браузер запущен: {context.name}")
+        return context
+
+    def block_urls(self, driver):
+        """Отсечение шрифтов, медиа и рекламы на уровне сети через CDP"""
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.BLOCKED_URLS})
+        except Exception as e:
+            print(f"[BrowserPool] ⚠️ Не удалось включить блокировку ресурсов: {e}")
+
+    def start_context(self):
+        """Запуск нового контекста с учетом лимита пула"""
+        try:
+            return self.create_context()
+        except Exception:
+            with self.condition:
+                self.starting -= 1
+                self.condition.notify()
+            raise
+
+    def prewarm(self, count=None):
+        """Фоновый запуск браузеров, чтобы первый проход не ждал старта Chrome"""
+        count = self.size if count is None else min(count, self.size)
+        with self.condition:
+            to_start = max(0, count - len(self.idle) - len(self.busy) - self.starting)
+            self.starting += to_start
+
+        for _ in range(to_start):
+            threading.Thread(target=self.warm_one, name='browser-prewarm', daemon=True).start()
+
+    def warm_one(self):
+        try:
+            context = self.start_context()
+        except Exception as e:
+            print(f"[BrowserPool] ❌ Ошибка запуска браузера: {e}")
+            return
+
+        with self.condition:
+            self.starting -= 1
+            if self.closed:
+                context.quit()
+                return
+            self.idle.append(context)
+            self.condition.notify()
+
+    def checkout(self, timeout=300):
+        """Свободный браузер с рабочим прокси; при необходимости запускает новый"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                while self.idle:
+                    context = self.idle.pop()
+                    if context.proxy and not self.proxy_pool.is_available(context.proxy):
+                        # Прокси выведен из ротации — браузер с ним больше не нужен
+                        print(f"[BrowserPool] 🔄 Прокси {context.name} недоступен, браузер остановлен")
+                        self.retire(context, replace=False)
+                        continue
+                    self.busy.add(context)
+                    return context
+
+                if len(self.busy) + self.starting < self.size:
+                    self.starting += 1
+                    break
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError("Нет свободного браузера в пуле")
+                self.condition.wait(remaining)
+
+        context = self.start_context()
+        with self.condition:
+            self.starting -= 1
+            self.busy.add(context)
+        return context
+
+    def checkin(self, context):
+        """Возврат браузера в пул или перезапуск после блокировки, N страниц, роста памяти"""
+        context.last_used = time.time()
+        reason = None
+        if context.blocked:
+            reason = 'блокировка'
+        elif context.pages >= self.max_pages:
+            reason = f'{context.pages} страниц'
+        else:
+            rss = context.rss_mb()
+            if rss > self.max_rss_mb:
+                reason = f'память {rss:.0f} МБ'
+
+        with self.condition:
+            self.busy.discard(context)
+            if reason or self.closed:
+                self.retire(context, replace=self.keep_warm and not self.closed)
+                if reason:
+                    print(f"[BrowserPool] ♻️ Браузер {context.name} перезапускается: {reason}")
+            else:
+                self.idle.append(context)
+            self.condition.notify()
+
+    def retire(self, context, replace=True):
+        """Остановка браузера в фоне; замена прогревается, пока он не понадобился"""
+        self.recycled += 1
+        threading.Thread(target=context.quit, name='browser-quit', daemon=True).start()
+        if replace:
+            self.starting += 1
+            threading.Thread(target=self.warm_one, name='browser-prewarm', daemon=True).start()
+
+    def release_idle(self):
+        """Остановка браузеров, простаивающих дольше idle_timeout"""
+        now = time.time()
+        with self.condition:
+            stale = [context for context in self.idle if now - context.last_used > self.idle_timeout]
+            self.idle = [context for context in self.idle if context not in stale]
+
+        for context in stale:
+            context.quit()
+            print(f"[BrowserPool] 💤 Браузер {context.name} остановлен по простою")
+
+    def rss_mb(self):
+        """Суммарная память всех запущенных браузеров"""
+        with self.condition:
+            contexts = self.idle + list(self.busy)
+        return sum(context.rss_mb() for context in contexts)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'idle': len(self.idle),
+                'busy': len(self.busy),
+                'starting': self.starting,
+                'started': self.started,
+                'recycled': self.recycled,
+            }
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            contexts = self.idle + list(self.busy)
+            self.idle = []
+            self.busy.clear()
+
+        for context in contexts:
+            context.quit()
@@ -1,18 +1,83 @@
 import os
+import json
 from dotenv import load_dotenv
+from urllib3.util.request import ACCEPT_ENCODING
 
 load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 
+# Лимиты Telegram Bot API: всего в секунду, в личный чат в секунду, в группу в минуту
+TELEGRAM_GLOBAL_RATE = int(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+TELEGRAM_CHAT_RATE = int(os.getenv('TELEGRAM_CHAT_RATE', 1))
+TELEGRAM_GROUP_RATE = int(os.getenv('TELEGRAM_GROUP_RATE', 20))
+# Сколько объявлений с фото объединять в один альбом (1 — без группировки)
+TELEGRAM_MEDIA_GROUP_SIZE = int(os.getenv('TELEGRAM_MEDIA_GROUP_SIZE', 1))
+
 AVITO_SEARCH_URL = os.getenv('AVITO_SEARCH_URL')
 CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', 1800))  # 30 минут по умолчанию
+# Адаптивное расписание: интервал каждого поиска подстраивается под частоту новых объявлений
+MIN_CHECK_INTERVAL = int(os.getenv('MIN_CHECK_INTERVAL', 180))
+MAX_CHECK_INTERVAL = int(os.getenv('MAX_CHECK_INTERVAL', 3600))
+CHECK_JITTER = float(os.getenv('CHECK_JITTER', 0.2))  # ±20% к интервалу
+NIGHT_HOURS = os.getenv('NIGHT_HOURS', '1-7')  # Часы, когда интервал увеличивается
+NIGHT_SLOWDOWN = float(os.getenv('NIGHT_SLOWDOWN', 3))
+# Не больше стольких запросов страниц в час на один рабочий прокси
+REQUESTS_PER_PROXY_HOUR = int(os.getenv('REQUESTS_PER_PROXY_HOUR', 20))
+
+# Метрики: эндпоинт Prometheus (0 — отключить) и файл со снимком после каждого прохода
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+METRICS_FILE = os.getenv('METRICS_FILE', 'metrics.jsonl')
+# Ротация файла метрик: при превышении размера он уходит в .1, .2, ... (старше METRICS_FILE_BACKUPS удаляются)
+METRICS_FILE_MAX_MB = float(os.getenv('METRICS_FILE_MAX_MB', 10))
+METRICS_FILE_BACKUPS = int(os.getenv('METRICS_FILE_BACKUPS', 3))
+# Основной режим: 'http' (requests, браузер только при проверке) или 'browser'
+SCRAPE_MODE = os.getenv('SCRAPE_MODE', 'http')
+# Через сколько секунд простоя останавливать Chrome
+BROWSER_IDLE_TIMEOUT = int(os.getenv('BROWSER_IDLE_TIMEOUT', 600))
+# Пул прогретых браузеров: размер, перезапуск после N страниц или роста памяти
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', 2))
+BROWSER_MAX_PAGES = int(os.getenv('BROWSER_MAX_PAGES', 50))
+BROWSER_MAX_RSS_MB = int(os.getenv('BROWSER_MAX_RSS_MB', 1500))
+# Не загружать в браузере картинки, шрифты, медиа, рекламу и счетчики (нужен только текст карточек)
+BROWSER_BLOCK_ASSETS = os.getenv('BROWSER_BLOCK_ASSETS', 'true').lower() in ('1', 'true', 'yes')
+# Сколько браузеров запускать заранее (в режиме 'http' браузер нужен только при проверке)
+BROWSER_PREWARM = int(os.getenv('BROWSER_PREWARM', BROWSER_POOL_SIZE if SCRAPE_MODE == 'browser' else 0))
+MAX_CARDS_PER_PAGE = int(os.getenv('MAX_CARDS_PER_PAGE', 50))
+# Сколько страниц выдачи обходить максимум (обход останавливается раньше на известных объявлениях)
+MAX_PAGES = int(os.getenv('MAX_PAGES', 3))
+SEEN_CARDS_PER_SEARCH = int(os.getenv('SEEN_CARDS_PER_SEARCH', 2000))
+
+# Кэш уже встреченных объявлений перед базой
+SEEN_CACHE_SIZE = int(os.getenv('SEEN_CACHE_SIZE', 10000))
+SEEN_BLOOM_CAPACITY = int(os.getenv('SEEN_BLOOM_CAPACITY', 100000))
+# Сколько символов описания хранить в объявлении (столько же показывается в сообщении)
+DESCRIPTION_MAX_LENGTH = int(os.getenv('DESCRIPTION_MAX_LENGTH', 300))
+
+# Изменения объявлений: снятым считается пропавшее из выдачи столько проходов подряд
+LISTING_REMOVED_AFTER_MISSES = int(os.getenv('LISTING_REMOVED_AFTER_MISSES', 2))
+NOTIFY_PRICE_DROPS = os.getenv('NOTIFY_PRICE_DROPS', 'true').lower() in ('1', 'true', 'yes')
+NOTIFY_RELISTED = os.getenv('NOTIFY_RELISTED', 'true').lower() in ('1', 'true', 'yes')
+# Каталог архива старых объявлений (Parquet по дням, нужен pyarrow)
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
 
 PROXY_HOST=os.getenv('PROXY_HOST')
 PROXY_PORT=os.getenv('PROXY_PORT')
 PROXY_USER=os.getenv('PROXY_USER')
 PROXY_PASS=os.getenv('PROXY_PASS')
+# Дополнительные прокси: список через запятую и/или файл, по одному в строке
+# Формат: [http|socks5://][user:pass@]host:port
+PROXY_LIST = os.getenv('PROXY_LIST', '')
+PROXY_FILE = os.getenv('PROXY_FILE', 'working_proxies.txt')
+PROXY_STATE_FILE = os.getenv('PROXY_STATE_FILE', 'proxy_state.json')
+
+# Фоновая перепроверка прокси (0 — отключить)
+PROXY_REVALIDATE_INTERVAL = int(os.getenv('PROXY_REVALIDATE_INTERVAL', 300))
+PROXY_CHECK_URL = os.getenv('PROXY_CHECK_URL', 'https://www.avito.ru/robots.txt')
+PROXY_CHECK_TIMEOUT = int(os.getenv('PROXY_CHECK_TIMEOUT', 10))
+PROXY_CHECK_CONCURRENCY = int(os.getenv('PROXY_CHECK_CONCURRENCY', 50))
 
 TARGET_METRO_STATIONS = {
     'киевская', 'парк культуры', 'октябрьская', 'добрынинская',
@@ -23,6 +88,13 @@ TARGET_METRO_STATIONS = {
     'дубровка', 'кожуховская', 'электрозаводская', 'семеновская'
 }
 
+# Станции кольцевой линии (повышают оценку объявления)
+RING_METRO_STATIONS = {
+    'киевская', 'парк культуры', 'октябрьская', 'добрынинская',
+    'павелецкая', 'таганская', 'курская', 'комсомольская',
+    'проспект мира', 'новослободская', 'белорусская', 'краснопресненская'
+}
+
 # Более мягкие критерии
 FILTER_CRITERIA = {
     'min_area': 30,
@@ -32,10 +104,44 @@ FILTER_CRITERIA = {
     'preferred_repair': ['евроремонт', 'дизайнерский ремонт', 'хороший ремонт']
 }
 
+# Несколько поисков (районы, ценовые диапазоны) из JSON-файла:
+# [{"name": "center", "url": "https://...", "chat_id": "123", "filter": {"max_price": 80000}}]
+# chat_id и filter поиска при первом запуске становятся профилем подписчика (см. subscriptions.py)
+SEARCHES_FILE = os.getenv('SEARCHES_FILE', 'searches.json')
+SCRAPER_WORKERS = int(os.getenv('SCRAPER_WORKERS', 4))
+
+
+def load_searches():
+    """Список поисков: из SEARCHES_FILE или одиночный поиск из AVITO_SEARCH_URL"""
+    searches = [{'name': 'default', 'url': AVITO_SEARCH_URL}]
+    if os.path.exists(SEARCHES_FILE):
+        with open(SEARCHES_FILE, encoding='utf-8') as f:
+            searches = json.load(f)
+
+    for i, search in enumerate(searches):
+        search.setdefault('name', f'search_{i + 1}')
+        if not search.get('url'):
+            search['url'] = "https://www.avito.ru/moskva/kvartiry/sdam"
+        search['chat_id'] = search.get('chat_id') or TELEGRAM_CHAT_ID
+        search['filter'] = {**FILTER_CRITERIA, **search.get('filter', {})}
+
+    return searches
+
+
+SEARCHES = load_searches()
+
 HEADERS = {
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
     'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
-    'Accept-Encoding': 'gzip, deflate',
+    # gzip/deflate, а также br и zstd, если установлены brotli и zstandard
+    'Accept-Encoding': ACCEPT_ENCODING,
     'Connection': 'keep-alive',
     'Upgrade-Insecure-Requests': '1',
 }
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+]
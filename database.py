@@ -1,122 +1,358 @@
 import sqlite3
 import hashlib
+import json
+import re
+import threading
+import time
 from datetime import datetime, timedelta
 
+from config import SEEN_CACHE_SIZE, SEEN_BLOOM_CAPACITY
+from metrics import METRICS
+from seen_cache import SeenCache
+
 
 class ApartmentDB:
+    # Настройки соединения: WAL и отложенный fsync, заметно быстрее для частых записей
+    PRAGMAS = (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA mmap_size=268435456',  # 256 МБ
+        'PRAGMA cache_size=-65536',  # 64 МБ
+    )
+
+    # Размер пачки параметров для запросов IN (...)
+    QUERY_CHUNK_SIZE = 500
+
+    # Версия схемы в PRAGMA user_version: 1 — ключ apartment_id по id Avito
+    SCHEMA_VERSION = 1
+    # Id объявления в конце URL Avito: .../2-k._kvartira_54m_722et._1234567890
+    URL_ID_PATTERN = re.compile(r'_(\d+)(?:[?#]|$)')
+
     def __init__(self, db_name='apartments.db'):
         self.db_name = db_name
+        self.lock = threading.RLock()
+        self.conn = self.connect()
         self.init_db()
 
+        # Кэш уже встреченных объявлений, прогреваем содержимым таблицы
+        self.seen_cache = SeenCache(lru_size=SEEN_CACHE_SIZE, bloom_capacity=SEEN_BLOOM_CAPACITY)
+        self.warm_seen_cache()
+
+    def connect(self):
+        """Открытие долгоживущего соединения с настройками производительности"""
+        conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def close(self):
+        """Закрытие соединения"""
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
     def init_db(self):
         """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS apartments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                apartment_id TEXT UNIQUE,
-                avito_id TEXT,
-                title TEXT,
-                price TEXT,
-                price_num INTEGER,
-                location TEXT,
-                url TEXT,
-                image_url TEXT,
-                description TEXT,
-                rooms INTEGER,
-                area REAL,
-                metro_stations TEXT,
-                metro_time INTEGER,
-                date_published TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        with self.lock, self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS apartments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    apartment_id TEXT UNIQUE,
+                    avito_id TEXT,
+                    title TEXT,
+                    price TEXT,
+                    price_num INTEGER,
+                    location TEXT,
+                    url TEXT,
+                    image_url TEXT,
+                    description TEXT,
+                    rooms INTEGER,
+                    area REAL,
+                    metro_stations TEXT,
+                    metro_time INTEGER,
+                    date_published TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_apartments_avito_id ON apartments (avito_id)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_apartments_created_at ON apartments (created_at)')
+            # Все встреченные карточки выдачи (не только подошедшие): по ним обход страниц останавливается
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS seen_cards (
+                    search TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    seen_at REAL,
+                    PRIMARY KEY (search, url)
+                ) WITHOUT ROWID
+            ''')
+            if self.conn.execute('PRAGMA user_version').fetchone()[0] < self.SCHEMA_VERSION:
+                self.migrate_apartment_keys()
+                self.conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    def migrate_apartment_keys(self):
+        """Перевод старых записей на ключ по id Avito, иначе после обновления они снова выглядели бы новыми"""
+        avito_ids = []
+        keys = []
+        for row_id, apartment_id, avito_id, url in self.conn.execute(
+                'SELECT id, apartment_id, avito_id, url FROM apartments'):
+            # В старых записях id Avito мог не сохраниться, но он есть в URL объявления
+            if not avito_id:
+                match = self.URL_ID_PATTERN.search(url or '')
+                if not match:
+                    continue
+                avito_id = match.group(1)
+                avito_ids.append((avito_id, row_id))
+            key = self.avito_key(avito_id)
+            if key != apartment_id:
+                keys.append((key, row_id))
 
-        conn.commit()
-        conn.close()
+        self.conn.executemany('UPDATE apartments SET avito_id = ? WHERE id = ?', avito_ids)
+        # Несколько старых записей одного объявления (разные цены): новый ключ получает первая
+        self.conn.executemany('UPDATE OR IGNORE apartments SET apartment_id = ? WHERE id = ?', keys)
+        if avito_ids or keys:
+            print(f"[ApartmentDB] 🔄 Миграция ключей: {len(avito_ids)} id из URL, {len(keys)} ключей обновлено")
 
-    def generate_apartment_id(self, apartment_data):
+    def warm_seen_cache(self):
+        """Загрузка ключей всех сохраненных квартир в фильтр Блума"""
+        with self.lock:
+            keys = []
+            for apartment_id, avito_id in self.conn.execute('SELECT apartment_id, avito_id FROM apartments'):
+                keys.append(apartment_id)
+                keys.append(avito_id)
+            self.seen_cache.rebuild(keys)
+
+    def generate_apartment_id(self, apartment):
         """Генерация уникального ID для квартиры"""
-        # Используем несколько параметров для уникальности
-        unique_string = f"{apartment_data.get('id', '')}{apartment_data['title']}{apartment_data.get('price_num', 0)}{apartment_data['location']}"
+        # Id Avito не меняется при смене цены, иначе то же объявление выглядело бы новым
+        if apartment.id:
+            return self.avito_key(apartment.id)
+
+        # Без id используем несколько параметров для уникальности
+        unique_string = f"{apartment.title}{apartment.price_num}{apartment.location}"
         return hashlib.md5(unique_string.encode()).hexdigest()
 
-    def is_new_apartment(self, apartment_data):
+    def avito_key(self, avito_id):
+        """Ключ apartment_id объявления с известным id Avito"""
+        return hashlib.md5(f"avito:{avito_id}".encode()).hexdigest()
+
+    def is_new_apartment(self, apartment):
         """Проверка, является ли квартира новой"""
-        apartment_id = self.generate_apartment_id(apartment_data)
+        return bool(self.filter_new([apartment]))
+
+    def filter_new(self, apartments):
+        """Отбор новых квартир из результата парсинга одним проходом по индексам"""
+        started = time.perf_counter()
+        keyed = []
+        seen_in_batch = set()
+        for apartment in apartments:
+            apartment_id = self.generate_apartment_id(apartment)
+            avito_id = apartment.id
+            # Дубликаты внутри одной выдачи тоже отбрасываем
+            if apartment_id in seen_in_batch or (avito_id and avito_id in seen_in_batch):
+                continue
+            seen_in_batch.add(apartment_id)
+            if avito_id:
+                seen_in_batch.add(avito_id)
+            keyed.append((apartment, apartment_id, avito_id))
+
+        # Сначала кэш в памяти, в базу идут только неоднозначные случаи
+        new_apartments = []
+        unknown = []
+        with self.lock:
+            for item in keyed:
+                state = self.seen_cache.lookup(item[1:])
+                if state is SeenCache.NEW:
+                    new_apartments.append(item)
+                elif state is SeenCache.UNKNOWN:
+                    unknown.append(item)
+
+            if unknown:
+                known_ids = self.find_existing('apartment_id', [apartment_id for _, apartment_id, _ in unknown])
+                known_avito_ids = self.find_existing('avito_id', [avito_id for _, _, avito_id in unknown if avito_id])
+
+                for item in unknown:
+                    _, apartment_id, avito_id = item
+                    if apartment_id in known_ids or avito_id in known_avito_ids:
+                        self.seen_cache.remember((apartment_id, avito_id))
+                    else:
+                        new_apartments.append(item)
+
+        # Сохраняем исходный порядок выдачи
+        new_keys = {id(apartment) for apartment, _, _ in new_apartments}
+        METRICS.observe('dedup', time.perf_counter() - started)
+        return [apartment for apartment, _, _ in keyed if id(apartment) in new_keys]
+
+    def find_existing(self, column, values):
+        """Значения column, которые уже есть в таблице"""
+        existing = set()
+        values = list(values)
 
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        with self.lock:
+            for start in range(0, len(values), self.QUERY_CHUNK_SIZE):
+                chunk = values[start:start + self.QUERY_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = self.conn.execute(
+                    f'SELECT {column} FROM apartments WHERE {column} IN ({placeholders})',
+                    chunk
+                )
+                existing.update(row[0] for row in cursor)
 
-        # Проверяем по ID и по Avito ID (если есть)
-        if apartment_data.get('id'):
-            cursor.execute(
-                'SELECT id FROM apartments WHERE apartment_id = ? OR avito_id = ?',
-                (apartment_id, apartment_data['id'])
+        return existing
+
+    def apartment_row(self, apartment):
+        """Подготовка строки для вставки в таблицу apartments"""
+        return apartment.to_db_row(self.generate_apartment_id(apartment))
+
+    def has_table(self, name):
+        return self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone() is not None
+
+    def old_rows(self, cutoff_date):
+        """Записи старше cutoff_date вместе с историей показа из listing_state, если она есть"""
+        has_state = self.has_table('listing_state')
+        state_columns = 's.first_seen, s.last_seen, s.status' if has_state else 'NULL, NULL, NULL'
+        state_join = 'LEFT JOIN listing_state s ON s.avito_id = a.avito_id' if has_state else ''
+
+        cursor = self.conn.execute(f'''
+            SELECT a.apartment_id, a.avito_id, a.title, a.price, a.price_num, a.location, a.url,
+                   a.description, a.rooms, a.area, a.metro_stations, a.metro_time, a.date_published,
+                   a.created_at, {state_columns}
+            FROM apartments a {state_join}
+            WHERE a.created_at < ?
+        ''', (cutoff_date,))
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def stale_state_rows(self, cutoff_date):
+        """Объявления из listing_state, не встречавшиеся с cutoff_date (снятые или пропавшие)
+
+        Квартиры, которые и так уходят в архив из apartments, сюда не попадают: их итоговый
+        статус уже есть в old_rows. Остальные — запись в архив с окончательным статусом.
+        """
+        if not self.has_table('listing_state'):
+            return []
+
+        cursor = self.conn.execute('''
+            SELECT NULL AS apartment_id, s.avito_id, s.title, NULL AS price, s.price_num, s.location, s.url,
+                   NULL AS description, s.rooms, s.area, NULL AS metro_stations, NULL AS metro_time,
+                   s.date_published, s.first_seen AS created_at, s.first_seen, s.last_seen, s.status
+            FROM listing_state s
+            WHERE s.last_seen < ? AND NOT EXISTS (
+                SELECT 1 FROM apartments a WHERE a.avito_id = s.avito_id AND a.created_at < ?
+            )
+        ''', (cutoff_date.timestamp(), cutoff_date))
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def listing_histories(self, avito_ids):
+        """История изменений объявлений одной строкой JSON на объявление (для архива)"""
+        histories = {}
+        avito_ids = list(avito_ids)
+        for start in range(0, len(avito_ids), self.QUERY_CHUNK_SIZE):
+            chunk = avito_ids[start:start + self.QUERY_CHUNK_SIZE]
+            cursor = self.conn.execute(
+                f'SELECT avito_id, seen_at, event, price_num, changes FROM listing_history '
+                f'WHERE avito_id IN ({",".join("?" * len(chunk))}) ORDER BY id',
+                chunk
             )
-        else:
-            cursor.execute('SELECT id FROM apartments WHERE apartment_id = ?', (apartment_id,))
+            for avito_id, seen_at, event, price, changes in cursor:
+                histories.setdefault(avito_id, []).append(
+                    [seen_at, event, price, json.loads(changes) if changes else None]
+                )
+        return {avito_id: json.dumps(events, ensure_ascii=False) for avito_id, events in histories.items()}
 
-        result = cursor.fetchone()
-        conn.close()
+    def stale_listing_ids(self, cutoff_date):
+        """Avito id объявлений, не встречавшихся в выдаче с cutoff_date"""
+        if not self.has_table('listing_state'):
+            return []
+        cursor = self.conn.execute('SELECT avito_id FROM listing_state WHERE last_seen < ?', (cutoff_date.timestamp(),))
+        return [row[0] for row in cursor]
 
-        return result is None
+    def prune_listing_state(self, avito_ids):
+        """Удаление состояния и истории объявлений из listing_state и listing_history"""
+        avito_ids = list(avito_ids)
+        for start in range(0, len(avito_ids), self.QUERY_CHUNK_SIZE):
+            chunk = avito_ids[start:start + self.QUERY_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            self.conn.execute(f'DELETE FROM listing_state WHERE avito_id IN ({placeholders})', chunk)
+            self.conn.execute(f'DELETE FROM listing_history WHERE avito_id IN ({placeholders})', chunk)
+        return len(avito_ids)
 
-    def add_apartment(self, apartment_data):
+    def all_cards_seen(self, search, urls):
+        """Все ли карточки уже встречались в выдаче поиска (в любом из прошлых проходов)"""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return True
+
+        found = 0
+        with self.lock:
+            for start in range(0, len(urls), self.QUERY_CHUNK_SIZE):
+                chunk = urls[start:start + self.QUERY_CHUNK_SIZE]
+                found += self.conn.execute(
+                    f'SELECT COUNT(*) FROM seen_cards WHERE search = ? AND url IN ({",".join("?" * len(chunk))})',
+                    (search, *chunk)
+                ).fetchone()[0]
+        return found == len(urls)
+
+    def remember_cards(self, search, urls, now=None):
+        """Отметка карточек обработанного прохода как встреченных"""
+        now = now or time.time()
+        rows = [(search, url, now) for url in dict.fromkeys(urls)]
+        if not rows:
+            return 0
+
+        with self.lock, self.conn:
+            self.conn.executemany('''
+                INSERT INTO seen_cards (search, url, seen_at) VALUES (?, ?, ?)
+                ON CONFLICT(search, url) DO UPDATE SET seen_at = excluded.seen_at
+            ''', rows)
+        return len(rows)
+
+    def add_apartment(self, apartment):
         """Добавление новой квартиры в базу"""
-        apartment_id = self.generate_apartment_id(apartment_data)
-
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
-        # Подготавливаем данные
-        metro_stations_str = ','.join(apartment_data['metro_info'].get('stations', []))
-        date_published = None
-
-        if apartment_data.get('date_published'):
-            try:
-                date_published = datetime.fromtimestamp(apartment_data['date_published'])
-            except:
-                pass
-
-        cursor.execute('''
-            INSERT OR IGNORE INTO apartments 
-            (apartment_id, avito_id, title, price, price_num, location, url, image_url, 
-             description, rooms, area, metro_stations, metro_time, date_published)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            apartment_id,
-            apartment_data.get('id'),
-            apartment_data['title'],
-            apartment_data['price'],
-            apartment_data.get('price_num'),
-            apartment_data['location'],
-            apartment_data['url'],
-            apartment_data['image_url'],
-            apartment_data['description'],
-            apartment_data.get('rooms'),
-            apartment_data.get('area'),
-            metro_stations_str,
-            apartment_data['metro_info'].get('time'),
-            date_published
-        ))
-
-        conn.commit()
-        conn.close()
-
-    def clean_old_apartments(self, days_old=7):
-        """Удаление старых записей из базы"""
-        cutoff_date = datetime.now() - timedelta(days=days_old)
+        self.add_apartments([apartment])
 
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+    def add_apartments(self, apartments):
+        """Добавление пачки квартир одной транзакцией"""
+        rows = [self.apartment_row(apartment) for apartment in apartments]
+        if not rows:
+            return 0
+
+        with METRICS.time('db_write'), self.lock, self.conn:
+            self.conn.executemany('''
+                INSERT OR IGNORE INTO apartments 
+                (apartment_id, avito_id, title, price, price_num, location, url, image_url, 
+                 description, rooms, area, metro_stations, metro_time, date_published)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self.seen_cache.remember(key for row in rows for key in row[:2])
+
+        return len(rows)
+
+    def clean_old_apartments(self, days_old=7, archive=None):
+        """Удаление старых записей и истории изменений из базы (с переносом в архив, если он передан)"""
+        cutoff_date = datetime.now() - timedelta(days=days_old)
 
-        cursor.execute('DELETE FROM apartments WHERE created_at < ?', (cutoff_date,))
-        deleted = cursor.rowcount
+        with self.lock, self.conn:
+            # Снятые и давно не встречавшиеся объявления уходят и из listing_state / listing_history
+            stale_ids = self.stale_listing_ids(cutoff_date)
+            if archive is not None:
+                # Удаляем только то, что удалось записать в архив; снятие после переноса квартиры
+                # в архив дописывается отдельной записью с окончательным статусом
+                rows = self.old_rows(cutoff_date) + self.stale_state_rows(cutoff_date)
+                histories = self.listing_histories(stale_ids)
+                for row in rows:
+                    row['history'] = histories.get(row['avito_id'])
+                archive.append(rows)
+            self.prune_listing_state(stale_ids)
+            self.conn.execute('DELETE FROM seen_cards WHERE seen_at < ?', (cutoff_date.timestamp(),))
+            cursor = self.conn.execute('DELETE FROM apartments WHERE created_at < ?', (cutoff_date,))
+            deleted = cursor.rowcount
 
-        conn.commit()
-        conn.close()
+        if deleted:
+            self.warm_seen_cache()
 
         return deleted
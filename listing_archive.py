@@ -0,0 +1,178 @@
+import os
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # Архив необязателен: без pyarrow старые записи просто удаляются
+    pa = None
+
+from config import ARCHIVE_DIR
+
+
+class ListingArchive:
+    """Архив старых объявлений в Parquet с разбиением по дням и аналитические запросы к нему"""
+
+    COMPRESSION = 'zstd'
+
+    def __init__(self, root=ARCHIVE_DIR):
+        if pa is None:
+            raise RuntimeError("Для архива объявлений нужен pyarrow (pip install pyarrow)")
+        self.root = root
+        self.schema = pa.schema([
+            ('apartment_id', pa.string()),
+            ('avito_id', pa.string()),
+            ('title', pa.string()),
+            ('price', pa.string()),
+            ('price_num', pa.int64()),
+            ('location', pa.string()),
+            ('url', pa.string()),
+            ('description', pa.string()),
+            ('rooms', pa.int64()),
+            ('area', pa.float64()),
+            ('metro_stations', pa.list_(pa.string())),
+            ('metro_time', pa.int64()),
+            ('date_published', pa.timestamp('s')),
+            ('created_at', pa.timestamp('s')),
+            ('first_seen', pa.timestamp('s')),
+            ('last_seen', pa.timestamp('s')),
+            ('status', pa.string()),
+            # События listing_history одной строкой JSON: [[время, событие, цена, изменения], ...]
+            ('history', pa.string()),
+        ])
+
+    @staticmethod
+    def available():
+        return pa is not None
+
+    @staticmethod
+    def to_datetime(value):
+        """Время из SQLite (строка или unix time) в datetime"""
+        if value is None or value == '':
+            return None
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value)
+        try:
+            return datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+
+    def normalize(self, row):
+        row = dict(row)
+        stations = row.get('metro_stations') or ''
+        row['metro_stations'] = stations if isinstance(stations, list) else [s for s in stations.split(',') if s]
+        for field in ('date_published', 'created_at', 'first_seen', 'last_seen'):
+            row[field] = self.to_datetime(row.get(field))
+        return {name: row.get(name) for name in self.schema.names}
+
+    def append(self, rows):
+        """Дозапись строк в раздел своего дня (новый файл на каждую запись, старые не трогаем)"""
+        by_day = defaultdict(list)
+        for row in rows:
+            row = self.normalize(row)
+            day = (row['created_at'] or datetime.now()).strftime('%Y-%m-%d')
+            by_day[day].append(row)
+
+        written = 0
+        for day, day_rows in by_day.items():
+            directory = os.path.join(self.root, f'day={day}')
+            os.makedirs(directory, exist_ok=True)
+            table = pa.Table.from_pylist(day_rows, schema=self.schema)
+            name = f'part-{int(time.time())}-{uuid.uuid4().hex[:8]}.parquet'
+            path = os.path.join(directory, name)
+            # Пишем во временный (скрытый для dataset) файл, чтобы читатели не увидели недописанный
+            tmp_path = os.path.join(directory, f'.{name}.tmp')
+            pq.write_table(table, tmp_path, compression=self.COMPRESSION)
+            os.replace(tmp_path, path)
+            written += len(day_rows)
+
+        return written
+
+    def dataset(self):
+        return ds.dataset(self.root, format='parquet', partitioning='hive', schema=self.schema_with_day())
+
+    def schema_with_day(self):
+        return self.schema.append(pa.field('day', pa.string()))
+
+    def scan(self, columns, days=None, extra_filter=None):
+        """Только нужные колонки и разделы; весь архив в память не загружается"""
+        if not os.path.isdir(self.root):
+            return pa.Table.from_pylist([], schema=pa.schema([self.schema_with_day().field(c) for c in columns]))
+
+        condition = extra_filter
+        if days:
+            since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+            day_filter = ds.field('day') >= since
+            condition = day_filter if condition is None else condition & day_filter
+
+        return self.dataset().to_table(columns=columns, filter=condition)
+
+    def median_price_by_station(self, days=None, rooms=None):
+        """Медианная цена по станциям метро: {станция: (медиана, число объявлений)}"""
+        condition = (ds.field('price_num') > 0)
+        if rooms is not None:
+            condition = condition & (ds.field('rooms') == rooms)
+        table = self.scan(['metro_stations', 'price_num'], days, condition)
+        if not table.num_rows:
+            return {}
+
+        # Объявление у нескольких станций учитывается у каждой
+        stations = pc.list_flatten(table['metro_stations'])
+        prices = pc.take(table['price_num'], pc.list_parent_indices(table['metro_stations']))
+        exploded = pa.table({'station': stations, 'price_num': prices})
+
+        result = exploded.group_by('station').aggregate([
+            ('price_num', 'approximate_median'), ('price_num', 'count')
+        ])
+        rows = zip(result['station'].to_pylist(),
+                   result['price_num_approximate_median'].to_pylist(),
+                   result['price_num_count'].to_pylist())
+        return {station: (round(median), count) for station, median, count in sorted(rows, key=lambda r: r[1])}
+
+    def time_on_market(self, days=None):
+        """Сколько часов объявления висят до снятия: медиана, квартили и число снятых"""
+        table = self.scan(['first_seen', 'last_seen'], days, ds.field('status') == 'removed')
+        table = table.filter(pc.and_(pc.is_valid(table['first_seen']), pc.is_valid(table['last_seen'])))
+        if not table.num_rows:
+            return {}
+
+        seconds = pc.divide(
+            pc.cast(pc.subtract(pc.cast(table['last_seen'], pa.int64()), pc.cast(table['first_seen'], pa.int64())),
+                    pa.float64()),
+            3600.0
+        )
+        q25, median, q75 = pc.quantile(seconds, q=[0.25, 0.5, 0.75]).to_pylist()
+        return {'count': table.num_rows, 'median_hours': median, 'p25_hours': q25, 'p75_hours': q75}
+
+    def listings_per_hour(self, days=None):
+        """Среднее число новых объявлений по часам суток (по времени публикации)"""
+        table = self.scan(['date_published'], days)
+        table = table.filter(pc.is_valid(table['date_published']))
+        if not table.num_rows:
+            return {}
+
+        hours = pc.hour(table['date_published'])
+        dates = pc.strftime(table['date_published'], format='%Y-%m-%d')
+        day_count = max(1, len(pc.unique(dates)))
+        counts = pa.table({'hour': hours}).group_by('hour').aggregate([('hour', 'count')])
+        return {hour: count / day_count
+                for hour, count in sorted(zip(counts['hour'].to_pylist(), counts['hour_count'].to_pylist()))}
+
+
+if __name__ == "__main__":
+    archive = ListingArchive()
+
+    print("📊 Медианная цена по станциям (90 дней):")
+    for station, (median, count) in archive.median_price_by_station(days=90).items():
+        print(f"  {station}: {median:,} ₽ ({count} объявлений)".replace(',', ' '))
+
+    print(f"⏳ Время до снятия: {archive.time_on_market(days=90)}")
+
+    print("🕐 Новых объявлений в час:")
+    for hour, count in archive.listings_per_hour(days=30).items():
+        print(f"  {hour:02d}:00 — {count:.1f}")
@@ -0,0 +1,273 @@
+import hashlib
+import json
+import time
+from collections import namedtuple
+
+from config import LISTING_REMOVED_AFTER_MISSES
+from metrics import METRICS
+
+ListingEvent = namedtuple('ListingEvent', ['kind', 'avito_id', 'apartment', 'old_price', 'new_price'])
+
+
+class ListingChangeTracker:
+    """Отслеживание изменений объявлений по Avito id: новые, снижение/рост цены, повтор, снятие"""
+
+    NEW = 'new'
+    PRICE_DOWN = 'price_down'
+    PRICE_UP = 'price_up'
+    RELISTED = 'relisted'
+    REMOVED = 'removed'
+    KINDS = (NEW, PRICE_DOWN, PRICE_UP, RELISTED, REMOVED)
+
+    ACTIVE = 'active'
+    GONE = 'removed'
+
+    # Поля, изменения которых пишутся в историю
+    TRACKED_FIELDS = ('price_num', 'title', 'location', 'area', 'rooms')
+
+    def __init__(self, db, removed_after_misses=LISTING_REMOVED_AFTER_MISSES):
+        self.db = db
+        self.removed_after_misses = removed_after_misses
+        self.subscribers = []
+        self.init_tables()
+
+    def init_tables(self):
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute('''
+                CREATE TABLE IF NOT EXISTS listing_state (
+                    avito_id TEXT PRIMARY KEY,
+                    search TEXT,
+                    fingerprint TEXT,
+                    price_num INTEGER,
+                    title TEXT,
+                    location TEXT,
+                    area REAL,
+                    rooms INTEGER,
+                    url TEXT,
+                    date_published REAL,
+                    first_seen REAL,
+                    last_seen REAL,
+                    missed_sweeps INTEGER DEFAULT 0,
+                    status TEXT
+                )
+            ''')
+            self.db.conn.execute('''
+                CREATE TABLE IF NOT EXISTS listing_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    avito_id TEXT,
+                    seen_at REAL,
+                    event TEXT,
+                    price_num INTEGER,
+                    changes TEXT
+                )
+            ''')
+            self.db.conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_listing_state_fingerprint ON listing_state (fingerprint)'
+            )
+            self.db.conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_listing_state_search ON listing_state (search, status)'
+            )
+            self.db.conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_listing_history_avito_id ON listing_history (avito_id)'
+            )
+
+    def subscribe(self, callback, kinds=None):
+        """Подписка на события: callback(event) для указанных типов (по умолчанию — всех)"""
+        self.subscribers.append((callback, set(kinds or self.KINDS)))
+
+    def emit(self, events):
+        for event in events:
+            METRICS.inc('listing_events', kind=event.kind)
+            for callback, kinds in self.subscribers:
+                if event.kind in kinds:
+                    try:
+                        callback(event)
+                    except Exception as e:
+                        print(f"[ListingChanges] ❌ Ошибка обработчика {event.kind}: {e}")
+
+    @staticmethod
+    def fingerprint(apartment):
+        """Отпечаток квартиры без id и цены: по нему узнаем перевыложенные объявления"""
+        key = '|'.join(str(value or '').strip().lower()
+                       for value in (apartment.title, apartment.location, apartment.area, apartment.rooms))
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def load_states(self, column, values, status=None):
+        """Последнее известное состояние объявлений пачками по QUERY_CHUNK_SIZE (при status — только с ним)"""
+        states = {}
+        values = list(values)
+        status_clause = ' AND status = ?' if status else ''
+        for start in range(0, len(values), self.db.QUERY_CHUNK_SIZE):
+            chunk = values[start:start + self.db.QUERY_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = self.db.conn.execute(
+                f'SELECT avito_id, fingerprint, price_num, title, location, area, rooms, status '
+                f'FROM listing_state WHERE {column} IN ({placeholders}){status_clause}',
+                (*chunk, status) if status else chunk
+            )
+            for row in cursor:
+                state = dict(zip(('avito_id', 'fingerprint', 'price_num', 'title', 'location',
+                                  'area', 'rooms', 'status'), row))
+                states.setdefault(state[column], state)
+        return states
+
+    def process_sweep(self, apartments, searches=(), now=None):
+        """Сравнение выдачи с последним известным состоянием одним пакетным проходом"""
+        now = now or time.time()
+        apartments = [apartment for apartment in apartments if apartment.id]
+        by_id = {str(apartment.id): apartment for apartment in apartments}
+
+        events = []
+        state_rows = []
+        history_rows = []
+        price_updates = []
+
+        with METRICS.time('change_tracking'), self.db.lock, self.db.conn:
+            known = self.load_states('avito_id', by_id)
+
+            # Новые id могут оказаться перевыложенными старыми объявлениями — только уже снятыми:
+            # похожая активная карточка (та же квартира от другого продавца) — обычное новое объявление
+            fingerprints = {avito_id: self.fingerprint(apartment) for avito_id, apartment in by_id.items()}
+            unknown_prints = {fingerprints[avito_id] for avito_id in by_id if avito_id not in known}
+            previous = self.load_states('fingerprint', unknown_prints, self.GONE) if unknown_prints else {}
+
+            for avito_id, apartment in by_id.items():
+                state = known.get(avito_id)
+                price = apartment.price_num or 0
+                changes = {}
+
+                if state is None:
+                    earlier = previous.get(fingerprints[avito_id])
+                    if earlier and earlier['avito_id'] != avito_id and earlier['status'] == self.GONE:
+                        kind = self.RELISTED
+                        changes['previous_id'] = earlier['avito_id']
+                        old_price = earlier['price_num']
+                    else:
+                        kind = self.NEW
+                        old_price = None
+                    events.append(ListingEvent(kind, avito_id, apartment, old_price, price))
+                    history_rows.append((avito_id, now, kind, price, json.dumps(changes) if changes else None))
+                else:
+                    for field in self.TRACKED_FIELDS:
+                        value = getattr(apartment, field)
+                        if value is not None and value != state[field]:
+                            changes[field] = [state[field], value]
+
+                    kind = None
+                    if state['status'] == self.GONE:
+                        kind = self.RELISTED
+                    elif price and state['price_num'] and price != state['price_num']:
+                        kind = self.PRICE_DOWN if price < state['price_num'] else self.PRICE_UP
+                        price_updates.append((apartment.price, price, avito_id))
+
+                    if kind:
+                        events.append(ListingEvent(kind, avito_id, apartment, state['price_num'], price))
+                    if kind or changes:
+                        history_rows.append((avito_id, now, kind or 'changed', price,
+                                             json.dumps(changes, ensure_ascii=False) if changes else None))
+
+                state_rows.append((
+                    avito_id, apartment.search, fingerprints[avito_id], price,
+                    apartment.title, apartment.location, apartment.area,
+                    apartment.rooms, apartment.url, apartment.date_published,
+                    now, now
+                ))
+
+            self.db.conn.executemany('''
+                INSERT INTO listing_state
+                (avito_id, search, fingerprint, price_num, title, location, area, rooms, url,
+                 date_published, first_seen, last_seen, missed_sweeps, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 'active')
+                ON CONFLICT(avito_id) DO UPDATE SET
+                    search = excluded.search,
+                    fingerprint = excluded.fingerprint,
+                    price_num = excluded.price_num,
+                    title = excluded.title,
+                    location = excluded.location,
+                    area = COALESCE(excluded.area, area),
+                    rooms = COALESCE(excluded.rooms, rooms),
+                    url = excluded.url,
+                    date_published = COALESCE(excluded.date_published, date_published),
+                    last_seen = excluded.last_seen,
+                    missed_sweeps = 0,
+                    status = 'active'
+            ''', state_rows)
+
+            # Старая цена в основной таблице больше не актуальна
+            if price_updates:
+                self.db.conn.executemany(
+                    'UPDATE apartments SET price = ?, price_num = ? WHERE avito_id = ?', price_updates
+                )
+
+            events.extend(self.detect_removed(apartments, by_id, searches, now, history_rows))
+
+            if history_rows:
+                self.db.conn.executemany(
+                    'INSERT INTO listing_history (avito_id, seen_at, event, price_num, changes) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    history_rows
+                )
+
+        self.emit(events)
+        return events
+
+    def detect_removed(self, apartments, by_id, searches, now, history_rows):
+        """Снятые объявления: пропали из обойденного окна выдачи несколько проходов подряд
+
+        Обход останавливается на известных страницах, поэтому отсутствие объявления
+        что-то значит только внутри окна дат, которое проход действительно покрыл.
+        Окно у каждого поиска свое — по его собственной выдаче; поиск без выдачи
+        (пустая или не изменившаяся страница) в этот раз не проверяется.
+        """
+        window_starts = {}
+        for apartment in apartments:
+            if not apartment.date_published:
+                continue
+            for search in apartment.searches or (apartment.search,):
+                if search in searches:
+                    window_starts[search] = min(window_starts.get(search, apartment.date_published),
+                                                apartment.date_published)
+        if not window_starts:
+            return []
+
+        rows = []
+        for search, window_start in window_starts.items():
+            cursor = self.db.conn.execute(
+                'SELECT avito_id, price_num, missed_sweeps FROM listing_state '
+                'WHERE status = ? AND search = ? AND date_published >= ?',
+                (self.ACTIVE, search, window_start)
+            )
+            rows.extend(cursor.fetchall())
+
+        events = []
+        missed = []
+        removed = []
+        for avito_id, price, missed_sweeps in rows:
+            if avito_id in by_id:
+                continue
+            if missed_sweeps + 1 >= self.removed_after_misses:
+                removed.append((now, avito_id))
+                history_rows.append((avito_id, now, self.REMOVED, price, None))
+                events.append(ListingEvent(self.REMOVED, avito_id, None, price, None))
+            else:
+                missed.append((avito_id,))
+
+        if missed:
+            self.db.conn.executemany(
+                'UPDATE listing_state SET missed_sweeps = missed_sweeps + 1 WHERE avito_id = ?', missed
+            )
+        if removed:
+            self.db.conn.executemany(
+                f"UPDATE listing_state SET status = '{self.GONE}', last_seen = ? WHERE avito_id = ?", removed
+            )
+        return events
+
+    def history(self, avito_id):
+        """История объявления: (время, событие, цена, изменения)"""
+        with self.db.lock:
+            cursor = self.db.conn.execute(
+                'SELECT seen_at, event, price_num, changes FROM listing_history WHERE avito_id = ? ORDER BY id',
+                (str(avito_id),)
+            )
+            return [(seen_at, event, price, json.loads(changes) if changes else {})
+                    for seen_at, event, price, changes in cursor]
@@ -0,0 +1,272 @@
+import re
+import json
+import html
+from itertools import islice
+from urllib.parse import unquote
+
+from lxml import etree, html as lxml_html
+
+from apartment import Apartment
+from metro import STATION_MATCHER
+
+
+class ListingParser:
+    """Разбор карточек объявлений со страницы поиска Avito"""
+
+    # Селекторы по data-marker, компилируем один раз
+    CARDS_XPATH = etree.XPath('//*[@data-marker="item"]')
+    TITLE_XPATH = etree.XPath('.//*[@data-marker="item-title"]')
+    PRICE_XPATH = etree.XPath('.//*[@data-marker="item-price"]')
+    PRICE_META_XPATH = etree.XPath('.//*[@data-marker="item-price"]//meta[@itemprop="price"]/@content')
+    ADDRESS_XPATH = etree.XPath('.//*[@data-marker="item-address"]')
+    PARAMS_XPATH = etree.XPath('.//*[@data-marker="item-specific-params"]')
+    DESCRIPTION_META_XPATH = etree.XPath('.//meta[@itemprop="description"]/@content')
+    IMAGE_XPATH = etree.XPath('.//img/@src')
+
+    # Встроенное состояние страницы с полной выдачей
+    STATE_SCRIPT_XPATH = etree.XPath('//script[@data-mfe-state]/text()')
+    INITIAL_DATA_XPATH = etree.XPath('//script[contains(text(), "__initialData__")]/text()')
+    INITIAL_DATA_RE = re.compile(r'window\.__initialData__\s*=\s*"(.*?)"\s*;', re.S)
+
+    def __init__(self, base_url="https://www.avito.ru", encoding='utf-8'):
+        self.base_url = base_url
+        # Для bytes кодировку задаем явно, иначе lxml считает страницу latin-1
+        self.bytes_parser = lxml_html.HTMLParser(encoding=encoding)
+
+    def parse(self, content, limit=None):
+        """Разбор HTML (bytes или str) в объявления Apartment"""
+        if not content:
+            return
+
+        if isinstance(content, bytes):
+            tree = lxml_html.fromstring(content, parser=self.bytes_parser)
+        else:
+            tree = lxml_html.fromstring(content)
+
+        # Основной источник — встроенный JSON выдачи, DOM остается запасным вариантом
+        items = self.extract_state_items(tree)
+        if items:
+            records, build = items, self.build_from_state
+        else:
+            records, build = self.iter_raw_cards(tree), self.build_apartment
+
+        for i, record in enumerate(islice(records, limit)):
+            try:
+                yield build(record)
+            except Exception as e:
+                print(f"[ListingParser] ⚠️ Ошибка обработки карточки {i + 1}: {e}")
+
+    def extract_state_items(self, tree):
+        """Поиск списка объявлений во встроенном состоянии страницы"""
+        for state in self.iter_states(tree):
+            items = self.find_items(state)
+            if items:
+                return items
+        return []
+
+    def iter_states(self, tree):
+        """Декодирование встроенных JSON-состояний страницы"""
+        for text in self.STATE_SCRIPT_XPATH(tree):
+            text = text.strip()
+            if text.startswith('{&'):
+                text = html.unescape(text)
+            try:
+                yield json.loads(text)
+            except ValueError:
+                continue
+
+        for script in self.INITIAL_DATA_XPATH(tree):
+            match = self.INITIAL_DATA_RE.search(script)
+            if not match:
+                continue
+            try:
+                yield json.loads(unquote(match.group(1)))
+            except ValueError:
+                continue
+
+    @staticmethod
+    def find_items(state):
+        """Первый список словарей, похожих на объявления (есть id и urlPath)"""
+        stack = [state]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                stack.extend(node.values())
+            elif isinstance(node, list):
+                if node and all(isinstance(item, dict) for item in node) \
+                        and any('id' in item and 'urlPath' in item for item in node):
+                    return [item for item in node if 'id' in item and 'urlPath' in item]
+                stack.extend(node)
+        return []
+
+    def build_from_state(self, item):
+        """Сборка данных квартиры из объявления во встроенном JSON"""
+        title = (item.get('title') or '').strip() or "Без названия"
+
+        url = item.get('urlPath') or ""
+        if url and not url.startswith('http'):
+            url = self.base_url + url
+
+        price_detailed = item.get('priceDetailed') or {}
+        price_num = price_detailed.get('value') or 0
+        price = price_detailed.get('fullString') or price_detailed.get('string') or "Цена не указана"
+
+        geo = item.get('geo') or {}
+        location = geo.get('formattedAddress') or (item.get('location') or {}).get('name') or "Адрес не указан"
+
+        # Станции и время до метро из геопривязок
+        references = geo.get('geoReferences') or []
+        metro_text = ' '.join(f"{ref.get('content', '')} {ref.get('after', '')}" for ref in references)
+        metro_stations, metro_time = self.extract_metro_info(metro_text)
+
+        description = (item.get('description') or '').strip()
+        rooms, area = self.extract_apartment_params(title, description)
+        if not metro_stations:
+            # Без геопривязок станции ищем в тексте объявления, как и при разборе карточки из DOM
+            metro_stations = STATION_MATCHER.find_stations(f"{title} {description} {location}")
+
+        coords = item.get('coords') or {}
+        date_published = item.get('sortTimeStamp')
+
+        return Apartment(
+            id=str(item['id']),
+            title=title,
+            price=price,
+            price_num=int(price_num),
+            location=location,
+            url=url,
+            description=description,
+            image_url=self.pick_image(item.get('images')),
+            rooms=rooms,
+            area=area,
+            metro_stations=metro_stations,
+            metro_time=metro_time,
+            coords=(coords['lat'], coords['lng']) if 'lat' in coords and 'lng' in coords else None,
+            date_published=date_published / 1000 if date_published else None
+        )
+
+    @staticmethod
+    def pick_image(images):
+        """URL самого крупного превью"""
+        if not images or not isinstance(images[0], dict):
+            return None
+
+        def width(size):
+            try:
+                return int(size.split('x')[0])
+            except ValueError:
+                return 0
+
+        sizes = images[0]
+        return sizes[max(sizes, key=width)] if sizes else None
+
+    def iter_raw_cards(self, tree):
+        """Извлечение сырых полей карточек из DOM"""
+        for card in self.CARDS_XPATH(tree):
+            title_elems = self.TITLE_XPATH(card)
+            title_elem = title_elems[0] if title_elems else None
+
+            price_meta = self.PRICE_META_XPATH(card)
+            description_meta = self.DESCRIPTION_META_XPATH(card)
+            images = self.IMAGE_XPATH(card)
+
+            yield {
+                'item_id': card.get('data-item-id'),
+                'title': self.first_text(title_elems),
+                'href': title_elem.get('href') if title_elem is not None else None,
+                'price': self.first_text(self.PRICE_XPATH(card)),
+                'price_value': price_meta[0] if price_meta else None,
+                'address': self.first_text(self.ADDRESS_XPATH(card)),
+                'params': self.first_text(self.PARAMS_XPATH(card)),
+                'description': description_meta[0] if description_meta else None,
+                'image_url': images[0] if images else None,
+            }
+
+    @staticmethod
+    def first_text(elements):
+        """Текст первого найденного элемента с нормализованными пробелами"""
+        if not elements:
+            return None
+        return ' '.join(part.strip() for part in elements[0].itertext() if part.strip())
+
+    def build_apartment(self, raw_card):
+        """Сборка данных квартиры из сырых полей карточки"""
+        title = (raw_card.get('title') or '').strip() or "Без названия"
+        url = raw_card.get('href') or ""
+        if url and not url.startswith('http'):
+            url = self.base_url + url
+
+        price = (raw_card.get('price') or '').strip()
+        if raw_card.get('price_value'):
+            price_num = self.extract_price_number(raw_card['price_value'])
+        else:
+            price_num = self.extract_price_number(price)
+        if not price:
+            price = "Цена не указана"
+
+        location = (raw_card.get('address') or '').strip() or "Адрес не указан"
+        description = (raw_card.get('params') or raw_card.get('description') or '').strip()
+
+        # Извлекаем параметры
+        rooms, area = self.extract_apartment_params(title, description)
+        metro_stations, metro_time = self.extract_metro_info(f"{title} {description} {location}")
+
+        return Apartment(
+            id=raw_card.get('item_id'),
+            title=title,
+            price=price,
+            price_num=price_num,
+            location=location,
+            url=url,
+            description=description,
+            image_url=raw_card.get('image_url'),
+            rooms=rooms,
+            area=area,
+            metro_stations=metro_stations,
+            metro_time=metro_time
+        )
+
+    def extract_price_number(self, price_text):
+        """Извлечение числового значения цены"""
+        try:
+            numbers = re.findall(r'\d+', price_text.replace(' ', ''))
+            if numbers:
+                return int(''.join(numbers))
+        except:
+            pass
+        return 0
+
+    def extract_apartment_params(self, title, description):
+        """Извлечение параметров квартиры"""
+        rooms = None
+        area = None
+
+        # Комнаты
+        if 'студия' in title.lower():
+            rooms = 0
+        else:
+            room_match = re.search(r'(\d+)-к', title.lower())
+            if room_match:
+                rooms = int(room_match.group(1))
+
+        # Площадь
+        area_match = re.search(r'(\d+(?:[.,]\d+)?)\s*м²', (title + ' ' + description))
+        if area_match:
+            area = float(area_match.group(1).replace(',', '.'))
+
+        return rooms, area
+
+    def extract_metro_info(self, text):
+        """Извлечение информации о метро: (станции, минут до метро)"""
+        metro_time = None
+        text_lower = text.lower()
+
+        # Время до метро
+        time_match = re.search(r'(\d+)\s*мин', text_lower)
+        if time_match:
+            metro_time = int(time_match.group(1))
+
+        # Станции метро
+        stations = STATION_MATCHER.find_stations(text)
+
+        return stations, metro_time
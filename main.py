@@ -1,59 +1,229 @@
-import schedule
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from datetime import datetime
 from avito_scraper import AdvancedAvitoScraper
 from telegram_bot import TelegramBot
 from database import ApartmentDB
-from config import CHECK_INTERVAL
+from proxy_pool import ProxyPool
+from proxy_revalidator import ProxyRevalidator
+from browser_pool import BrowserPool
+from scheduler import AdaptiveScheduler
+from metrics import METRICS
+from listing_changes import ListingChangeTracker
+from listing_archive import ListingArchive
+from subscriptions import SubscriptionManager
+from config import (
+    SEARCHES, SCRAPER_WORKERS, BROWSER_POOL_SIZE, BROWSER_PREWARM, NOTIFY_PRICE_DROPS, NOTIFY_RELISTED
+)
 
 
 class AdvancedApartmentMonitor:
     def __init__(self):
-        self.scraper = AdvancedAvitoScraper()
-        self.bot = TelegramBot()
+        self.searches = SEARCHES
+        # Общий пул прокси: статистика здоровья копится по всем воркерам
+        self.proxy_pool = ProxyPool.from_config()
+        # Прогретые браузеры выдаются воркерам на время прохода, одновременно нужно не больше воркеров
+        self.browser_pool = BrowserPool(
+            self.proxy_pool, size=max(1, min(BROWSER_POOL_SIZE, SCRAPER_WORKERS, len(self.searches)))
+        )
         self.db = ApartmentDB()
+        # Подписчики со своими фильтрами; профили поисков из конфигурации обновляются при каждом запуске
+        self.subscriptions = SubscriptionManager(self.db)
+        self.subscriptions.seed(self.searches)
+        # Отдельный скрапер (своя HTTP-сессия и прокси) на каждый поиск; карточки отбираются по профилям подписчиков
+        self.scrapers = {
+            search['name']: AdvancedAvitoScraper(
+                name=search['name'] if len(self.searches) > 1 else None,
+                proxy_pool=self.proxy_pool,
+                browser_pool=self.browser_pool,
+                subscriptions=self.subscriptions
+            )
+            for search in self.searches
+        }
+        # Фоновая перепроверка прокси: мертвые уходят из ротации без перезапуска
+        self.proxy_revalidator = ProxyRevalidator(self.proxy_pool)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, min(SCRAPER_WORKERS, len(self.searches))),
+            thread_name_prefix='scraper'
+        )
+        # Интервал каждого поиска подстраивается под частоту новых объявлений
+        self.scheduler = AdaptiveScheduler(
+            self.searches,
+            proxy_count=lambda: len(self.proxy_pool) - self.proxy_pool.open_count()
+        )
+        self.bot = TelegramBot()
+        # Изменения объявлений по Avito id: о снижении цены и повторной публикации сообщаем отдельно
+        self.listing_changes = ListingChangeTracker(self.db)
+        if NOTIFY_PRICE_DROPS:
+            self.listing_changes.subscribe(self.notify_listing_event, [ListingChangeTracker.PRICE_DOWN])
+        if NOTIFY_RELISTED:
+            self.listing_changes.subscribe(self.notify_listing_event, [ListingChangeTracker.RELISTED])
+        # Старые записи уходят в Parquet-архив, а не удаляются (если установлен pyarrow)
+        self.archive = ListingArchive() if ListingArchive.available() else None
+        if self.archive is None:
+            print("⚠️ pyarrow не установлен: старые записи будут удаляться без архива")
         self.last_block_notification = 0
         self.consecutive_blocks = 0
 
-    def check_new_apartments(self):
-        """Основная функция проверки новых квартир"""
+    def check_new_apartments(self, searches=None):
+        """Основная функция проверки новых квартир; возвращает итоги по каждому поиску"""
+        searches = searches or self.searches
         current_time = datetime.now()
-        print(f"[{current_time}] 🔍 Расширенная проверка квартир...")
+        print(f"[{current_time}] 🔍 Расширенная проверка квартир: {', '.join(s['name'] for s in searches)}")
 
+        summary = {search['name']: {'new': 0, 'blocked': False, 'failed': False} for search in searches}
+        new_apartments = []
+        committed = False
+        started = time.perf_counter()
         try:
-            results = self.scraper.get_apartments()
-            new_apartments_count = 0
-
-            # Проверяем на блокировку
-            for result in results:
-                if isinstance(result, dict) and result.get('blocked'):
-                    self.handle_block_notification(result)
-                    return  # Прекращаем обработку при блокировке
-
-                # Обычная обработка квартир
-                if self.db.is_new_apartment(result):
-                    print(f"✅ Новая квартира: {result['title'][:50]}...")
-
-                    self.bot.send_apartment_notification(result)
-                    self.db.add_apartment(result)
-
-                    new_apartments_count += 1
-                    time.sleep(2)
+            results_by_search = self.scrape_all(searches)
+
+            # Проверяем на блокировку: заблокированный или упавший поиск пропускаем, остальные обрабатываем
+            blocked = False
+            for search_name, results in results_by_search.items():
+                for result in results:
+                    if isinstance(result, dict) and result.get('blocked'):
+                        self.handle_block_notification(result)
+                        results_by_search[search_name] = []
+                        summary[search_name]['blocked'] = blocked = True
+                        break
+                    if isinstance(result, dict) and result.get('failed'):
+                        results_by_search[search_name] = []
+                        summary[search_name]['failed'] = True
+                        break
+
+            merged = self.merge_results(results_by_search)
+            # Получатели каждого объявления — по индексу профилей подписчиков
+            self.subscriptions.assign(merged)
+
+            # Изменения относительно прошлых проходов; снятие ищем только в успешно пройденных поисках
+            events = self.listing_changes.process_sweep(
+                merged, searches=[
+                    name for name in results_by_search
+                    if not summary[name]['blocked'] and not summary[name]['failed']
+                ]
+            )
+            # О перевыложенных сообщает подписка на RELISTED; без нее это обычное новое объявление
+            relisted = {
+                event.avito_id for event in events if event.kind == ListingChangeTracker.RELISTED
+            } if NOTIFY_RELISTED else set()
+
+            # Обычная обработка квартир: новизну проверяем одним запросом на всю выдачу
+            for result in self.db.filter_new(merged):
+                if str(result.id) in relisted:
+                    # Перевыложенное объявление: уже сообщали, повторная карточка не нужна
+                    new_apartments.append(result)
+                    continue
+
+                print(f"✅ Новая квартира: {result.title[:50]}...")
+
+                self.bot.send_apartment_notifications(result, result.chat_ids)
+                for search_name in result.searches:
+                    summary[search_name]['new'] += 1
+                new_apartments.append(result)
 
             # Сброс счетчика блокировок при успешной работе
-            self.consecutive_blocks = 0
+            if not blocked:
+                self.consecutive_blocks = 0
 
+            new_apartments_count = len(new_apartments)
             if new_apartments_count > 0:
                 print(f"📊 Найдено новых квартир: {new_apartments_count}")
                 self.bot.send_status_message(f"✅ Найдено {new_apartments_count} новых квартир")
             else:
                 print("📭 Новых квартир не найдено")
 
+            print(f"🧠 Кэш просмотренных: {self.db.seen_cache.stats()}")
+            committed = True
+
         except Exception as e:
             error_msg = f"❌ Критическая ошибка: {str(e)}"
             print(error_msg)
             self.bot.send_message(error_msg)
 
+        finally:
+            # Все отправленные за проверку квартиры пишем одной транзакцией
+            self.db.add_apartments(new_apartments)
+
+        # Условные запросы (ETag, хеш тела) и остановка обхода на известных карточках —
+        # только по страницам, выдача которых обработана и сохранена
+        for search_name in summary:
+            if committed and not summary[search_name]['blocked'] and not summary[search_name]['failed']:
+                for name, urls in self.scrapers[search_name].commit_sweep().items():
+                    self.db.remember_cards(name, urls)
+            else:
+                self.scrapers[search_name].discard_sweep()
+
+        for search_name in summary:
+            summary[search_name]['requests'] = self.scrapers[search_name].requests_made
+            METRICS.inc('cards_new', summary[search_name]['new'], search=search_name)
+
+        METRICS.observe('sweep', time.perf_counter() - started)
+        self.update_gauges()
+        METRICS.write_jsonl(searches=list(summary))
+        return summary
+
+    def update_gauges(self):
+        """Текущее состояние ресурсов для метрик"""
+        METRICS.set('browser_rss_mb', round(self.browser_pool.rss_mb(), 1))
+        METRICS.set('browsers', len(self.browser_pool))
+        METRICS.set('telegram_queue_depth', self.bot.delivery.pending())
+        METRICS.set('proxies', len(self.proxy_pool))
+        METRICS.set('proxies_open', self.proxy_pool.open_count())
+
+    def notify_listing_event(self, event):
+        """Уведомление о снижении цены или повторной публикации подписчикам объявления"""
+        print(f"🔔 {event.kind}: {event.apartment.title[:50]} ({event.old_price} → {event.new_price})")
+        for chat_id in event.apartment.chat_ids:
+            self.bot.send_listing_event_notification(event, chat_id)
+
+    def scrape_all(self, searches=None):
+        """Параллельный опрос поисков пулом воркеров"""
+        futures = {
+            self.executor.submit(
+                self.scrapers[search['name']].get_apartments, search, partial(self.all_known, search['name'])
+            ): search
+            for search in searches or self.searches
+        }
+
+        results_by_search = {}
+        for future in as_completed(futures):
+            search = futures[future]
+            try:
+                results_by_search[search['name']] = future.result()
+            except Exception as e:
+                # Например, пул прокси опустел: проход поиска неудачный, а не пустая выдача
+                print(f"❌ Ошибка поиска {search['name']}: {e}")
+                results_by_search[search['name']] = [{'failed': True, 'error': str(e)}]
+
+        return results_by_search
+
+    def all_known(self, search_name, cards):
+        """Все ли карточки уже встречались в выдаче поиска (для остановки обхода страниц)
+
+        Проверяются все карточки, а не только подошедшие под фильтры: в apartments попадают
+        лишь подошедшие, и после перезапуска обход по ним никогда бы не останавливался.
+        """
+        return self.db.all_cards_seen(search_name, [card.url for card in cards])
+
+    def merge_results(self, results_by_search):
+        """Объединение выдачи всех поисков без дубликатов"""
+        merged = {}
+        for results in results_by_search.values():
+            for apartment in results:
+                key = self.db.generate_apartment_id(apartment)
+                if key in merged:
+                    # Одна квартира нашлась в нескольких поисках — подписчики всех этих поисков;
+                    # повтор карточки внутри одной выдачи поиск не дублирует
+                    if apartment.search not in merged[key].searches:
+                        merged[key].searches.append(apartment.search)
+                else:
+                    apartment.searches = [apartment.search]
+                    merged[key] = apartment
+
+        return list(merged.values())
+
     def handle_block_notification(self, block_info):
         """Обработка уведомлений о блокировке"""
         self.consecutive_blocks += 1
@@ -88,12 +258,17 @@ class AdvancedApartmentMonitor:
 
             print(f"[Monitor] 📨 Отправлено уведомление о блокировке #{block_info['block_count']}")
 
+    def release_idle_browsers(self):
+        """Остановка простаивающих браузеров"""
+        self.browser_pool.release_idle()
+
     def daily_cleanup(self):
         """Ежедневная очистка"""
         try:
-            deleted = self.db.clean_old_apartments(days_old=7)
+            deleted = self.db.clean_old_apartments(days_old=7, archive=self.archive)
             if deleted > 0:
-                print(f"🗑️ Удалено старых записей: {deleted}")
+                action = "Перенесено в архив" if self.archive else "Удалено"
+                print(f"🗑️ {action} старых записей: {deleted}")
 
             # Сброс статистики блокировок
             self.consecutive_blocks = 0
@@ -119,19 +294,26 @@ class AdvancedApartmentMonitor:
 ⚡ Готов к работе в усложненных условиях!
         """)
 
-        # Увеличиваем интервал для стабильной работы
-        interval = max(CHECK_INTERVAL, 1800)  # Минимум 30 минут
-        schedule.every(interval).seconds.do(self.check_new_apartments)
-        schedule.every().day.at("06:00").do(self.daily_cleanup)
+        self.scheduler.daily_at("06:00", self.daily_cleanup)
+        self.scheduler.every(60, self.release_idle_browsers)
+
+        self.proxy_revalidator.start()
+        METRICS.start_server()
+        # Запуск Chrome и прогрев cookies — до первого прохода, а не во время него
+        self.browser_pool.prewarm(BROWSER_PREWARM)
 
-        # Первоначальная проверка
-        self.check_new_apartments()
+        searches_by_name = {search['name']: search for search in self.searches}
 
-        # Основной цикл
+        # Основной цикл: просыпаемся к ближайшему проходу, а не раз в минуту
         while True:
             try:
-                schedule.run_pending()
-                time.sleep(60)  # Проверяем расписание каждую минуту
+                due = self.scheduler.wait_due()
+                summary = self.check_new_apartments([searches_by_name[name] for name in due])
+                for name, result in summary.items():
+                    self.scheduler.record(
+                        name, result['new'], result['requests'], result['blocked'] or result['failed']
+                    )
+                print(f"⏱️ Расписание: {self.scheduler.stats()}")
             except KeyboardInterrupt:
                 print("\n🛑 Получен сигнал остановки...")
                 self.cleanup()
@@ -143,7 +325,15 @@ class AdvancedApartmentMonitor:
     def cleanup(self):
         """Очистка ресурсов при завершении"""
         print("🧹 Очистка ресурсов...")
-        self.scraper.cleanup()
+        self.proxy_revalidator.stop(timeout=5)
+        METRICS.stop_server()
+        self.executor.shutdown(wait=True)
+        for scraper in self.scrapers.values():
+            scraper.cleanup()
+        self.browser_pool.close()
+        self.proxy_pool.save_state(force=True)
+        self.db.close()
+        self.bot.close()
         self.bot.send_status_message("🛑 Мониторинг остановлен")
 
 
@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_HOST, METRICS_PORT, METRICS_FILE, METRICS_FILE_MAX_MB, METRICS_FILE_BACKUPS
+
+
+class Metric:
+    """Метрика с набором меток: значения хранятся по кортежу (имя метки, значение)"""
+
+    TYPE = None
+
+    def __init__(self, name, help_text, lock):
+        self.name = name
+        self.help = help_text
+        self.lock = lock
+        self.values = {}
+
+    @staticmethod
+    def label_key(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @staticmethod
+    def format_labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+    @staticmethod
+    def snapshot_key(key):
+        """Ключ для JSON: 'stage=parse,mode=http' или 'value' без меток"""
+        return ','.join(f'{name}={value}' for name, value in key) or 'value'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{self.format_labels(key)} {value}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {self.snapshot_key(key): value for key, value in self.values.items()}
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.label_key(labels)] = value
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def observe(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = {'buckets': [0] * len(self.BUCKETS), 'count': 0, 'sum': 0.0, 'last': 0.0}
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    data['buckets'][i] += 1
+            data['count'] += 1
+            data['sum'] += value
+            data['last'] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        with self.lock:
+            for key, data in self.values.items():
+                for bound, count in zip(self.BUCKETS, data['buckets']):
+                    lines.append(f"{self.name}_bucket{self.format_labels(key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{self.format_labels(key, [('le', '+Inf')])} {data['count']}")
+                lines.append(f"{self.name}_sum{self.format_labels(key)} {data['sum']}")
+                lines.append(f"{self.name}_count{self.format_labels(key)} {data['count']}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                self.snapshot_key(key): {'count': data['count'], 'sum': round(data['sum'], 4),
+                                                'last': round(data['last'], 4)}
+                for key, data in self.values.items()
+            }
+
+
+class MetricsRegistry:
+    """Счетчики, датчики и гистограммы этапов прохода с выводом в Prometheus и JSONL"""
+
+    PREFIX = 'avito_bot_'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.server = None
+
+        self.stage_seconds = self.histogram('stage_seconds', 'Длительность этапов прохода, с')
+
+    def register(self, cls, name, help_text):
+        name = self.PREFIX + name
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, help_text, self.lock)
+            return self.metrics[name]
+
+    def counter(self, name, help_text=''):
+        return self.register(Counter, name, help_text)
+
+    def gauge(self, name, help_text=''):
+        return self.register(Gauge, name, help_text)
+
+    def histogram(self, name, help_text=''):
+        return self.register(Histogram, name, help_text)
+
+    @contextmanager
+    def time(self, stage, **labels):
+        """Замер длительности этапа: with METRICS.time('parse'): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - started, stage=stage, **labels)
+
+    def observe(self, stage, seconds, **labels):
+        self.stage_seconds.observe(seconds, stage=stage, **labels)
+
+    def inc(self, event, amount=1, **labels):
+        """Счетчик событий: METRICS.inc('cards_seen', 50) -> avito_bot_cards_seen_total"""
+        self.counter(f'{event}_total').inc(amount, **labels)
+
+    def set(self, gauge, value, **labels):
+        self.gauge(gauge).set(value, **labels)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.items())
+        return {name[len(self.PREFIX):]: metric.snapshot() for name, metric in metrics}
+
+    def write_jsonl(self, filename=METRICS_FILE, **extra):
+        """Снимок метрик одной строкой JSON (после каждого прохода)"""
+        if not filename:
+            return
+        record = {'timestamp': time.time(), **extra, **self.snapshot()}
+        try:
+            self.rotate(filename)
+            with open(filename, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except Exception as e:
+            print(f"[Metrics] ⚠️ Ошибка записи метрик: {e}")
+
+    def rotate(self, filename, max_mb=METRICS_FILE_MAX_MB, backups=METRICS_FILE_BACKUPS):
+        """Ротация файла метрик по размеру: filename → filename.1 → ... → filename.<backups>"""
+        if not max_mb or not os.path.exists(filename) or os.path.getsize(filename) < max_mb * 1024 * 1024:
+            return
+
+        if backups < 1:
+            os.remove(filename)
+            return
+        for i in range(backups - 1, 0, -1):
+            if os.path.exists(f"{filename}.{i}"):
+                os.replace(f"{filename}.{i}", f"{filename}.{i + 1}")
+        os.replace(filename, f"{filename}.1")
+
+    def start_server(self, host=METRICS_HOST, port=METRICS_PORT):
+        """HTTP-эндпоинт /metrics для Prometheus в фоновом потоке"""
+        if not port or self.server:
+            return
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f"[Metrics] ⚠️ Не удалось открыть порт {port}: {e}")
+            return
+
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+        print(f"[Metrics] 📈 Метрики: http://{host}:{port}/metrics")
+
+    def stop_server(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+# Один реестр на процесс, общий для всех модулей
+METRICS = MetricsRegistry()
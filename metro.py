@@ -0,0 +1,54 @@
+import re
+from collections import namedtuple
+
+from config import TARGET_METRO_STATIONS
+
+StationMatch = namedtuple('StationMatch', ['station', 'start', 'end'])
+
+
+class StationMatcher:
+    """Поиск станций метро в тексте одним скомпилированным регулярным выражением"""
+
+    def __init__(self, stations):
+        self.stations = {self.normalize(station): station for station in stations}
+
+        # Длинные названия первыми, чтобы альтернатива не обрезала их на более коротких
+        alternatives = sorted(self.stations, key=len, reverse=True)
+        pattern = '|'.join(self.station_pattern(station) for station in alternatives)
+        self.regex = re.compile(rf'(?<!\w)(?:{pattern})(?!\w)', re.IGNORECASE) if alternatives else None
+
+    @staticmethod
+    def normalize(text):
+        """Приведение названия к каноническому виду (регистр, ё)"""
+        return ' '.join(text.casefold().replace('ё', 'е').split())
+
+    @staticmethod
+    def station_pattern(station):
+        """Шаблон станции: любые пробелы между словами, е/ё не различаются"""
+        words = [re.escape(word).replace('е', '[её]') for word in station.split()]
+        return r'\s+'.join(words)
+
+    def finditer(self, text):
+        """Все вхождения станций с позициями"""
+        if not self.regex or not text:
+            return
+        for match in self.regex.finditer(text):
+            station = self.stations.get(self.normalize(match.group()))
+            if station:
+                yield StationMatch(station, match.start(), match.end())
+
+    def find_all(self, text):
+        """Список вхождений станций с позициями"""
+        return list(self.finditer(text))
+
+    def find_stations(self, text):
+        """Уникальные найденные станции в порядке появления"""
+        return list(dict.fromkeys(match.station for match in self.finditer(text)))
+
+    def search(self, text):
+        """Первое вхождение станции или None"""
+        return next(self.finditer(text), None)
+
+
+# Строится один раз при импорте и переиспользуется всеми модулями
+STATION_MATCHER = StationMatcher(TARGET_METRO_STATIONS)
@@ -1,39 +1,119 @@
-import requests
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 import csv
+import json
+import time
+
+import aiohttp
+from aiohttp_socks import ProxyConnector
+
+
+class ResultStream:
+    """Запись результатов проверки в CSV/JSONL по мере их появления"""
+
+    FIELDNAMES = ['proxy', 'status', 'protocol', 'ip', 'response_time']
+
+    def __init__(self, csv_file=None, jsonl_file=None):
+        self.files = []
+        self.csv_writer = None
+        self.jsonl = None
+
+        if csv_file:
+            f = open(csv_file, 'w', newline='', encoding='utf-8')
+            self.files.append(f)
+            self.csv_writer = csv.DictWriter(f, fieldnames=self.FIELDNAMES)
+            self.csv_writer.writeheader()
+        if jsonl_file:
+            self.jsonl = open(jsonl_file, 'w', encoding='utf-8')
+            self.files.append(self.jsonl)
+
+    def write(self, result):
+        if self.csv_writer:
+            self.csv_writer.writerow(result)
+        if self.jsonl:
+            self.jsonl.write(json.dumps(result, ensure_ascii=False) + '\n')
+        for f in self.files:
+            f.flush()
+
+    def close(self):
+        for f in self.files:
+            f.close()
 
 
 class ProxyChecker:
-    def __init__(self):
+    PROTOCOLS = ('HTTP', 'SOCKS5', 'SOCKS4')
+
+    def __init__(self, target_url='http://httpbin.org/ip', timeout=10, concurrency=1000, race_delay=0.5):
         self.working_proxies = []
         self.failed_proxies = []
+        self.target_url = target_url
+        self.timeout = timeout
+        self.concurrency = concurrency
+        # Задержка перед запуском следующего протокола (happy eyeballs)
+        self.race_delay = race_delay
+        self.semaphore = None
+
+    async def probe(self, proxy, protocol):
+        """Один запрос к целевому URL через прокси указанного протокола"""
+        async with self.semaphore:
+            connector = ProxyConnector.from_url(f'{protocol.lower()}://{proxy}')
+            started = time.monotonic()
+            async with aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout)
+            ) as session:
+                async with session.get(self.target_url) as response:
+                    if response.status != 200:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status
+                        )
+                    body = await response.text()
 
-    def check_single_proxy(self, proxy):
-        """Проверка одного прокси"""
-        proxy_formats = [
-            {'http': f'http://{proxy}', 'https': f'http://{proxy}'},  # HTTP
-            {'http': f'socks5://{proxy}', 'https': f'socks5://{proxy}'},  # SOCKS5
-            {'http': f'socks4://{proxy}', 'https': f'socks4://{proxy}'}  # SOCKS4
-        ]
+        try:
+            ip = json.loads(body).get('origin', 'Unknown')
+        except (ValueError, AttributeError):
+            ip = 'Unknown'
 
-        for i, proxy_dict in enumerate(proxy_formats):
+        return {
+            'proxy': proxy,
+            'status': 'WORKING',
+            'protocol': protocol,
+            'ip': ip,
+            'response_time': time.monotonic() - started
+        }
+
+    async def staggered_probe(self, proxy, protocol, previous_failed, failed):
+        """Старт после ошибки предыдущего протокола или по истечении race_delay"""
+        if previous_failed is not None:
             try:
-                response = requests.get('http://httpbin.org/ip',
-                                        proxies=proxy_dict,
-                                        timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    protocol = ['HTTP', 'SOCKS5', 'SOCKS4'][i]
-                    return {
-                        'proxy': proxy,
-                        'status': 'WORKING',
-                        'protocol': protocol,
-                        'ip': data.get('origin', 'Unknown'),
-                        'response_time': response.elapsed.total_seconds()
-                    }
-            except Exception as e:
-                continue
+                await asyncio.wait_for(previous_failed.wait(), self.race_delay)
+            except asyncio.TimeoutError:
+                pass
+
+        try:
+            return await self.probe(proxy, protocol)
+        except Exception:
+            failed.set()
+            raise
+
+    async def check_single_proxy(self, proxy):
+        """Проверка одного прокси: протоколы соревнуются, побеждает первый успешный"""
+        tasks = []
+        previous_failed = None
+        for protocol in self.PROTOCOLS:
+            failed = asyncio.Event()
+            tasks.append(asyncio.create_task(self.staggered_probe(proxy, protocol, previous_failed, failed)))
+            previous_failed = failed
+
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    return await next_done
+                except Exception:
+                    continue
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
         return {
             'proxy': proxy,
@@ -43,50 +123,54 @@ class ProxyChecker:
             'response_time': 0
         }
 
-    def check_proxy_list(self, proxy_list, max_workers=10):
-        """Проверка списка прокси"""
+    async def iter_results(self, proxy_list):
+        """Результаты проверки по мере готовности"""
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.create_task(self.check_single_proxy(proxy)) for proxy in proxy_list]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Если обход прервали, недоделанные проверки отменяем и дожидаемся (их сессии закроются)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def check_proxy_list_async(self, proxy_list, csv_file=None, jsonl_file=None):
+        """Проверка списка прокси с потоковой записью результатов"""
         results = []
+        stream = ResultStream(csv_file, jsonl_file)
 
         print(f"[ProxyChecker] Проверка {len(proxy_list)} прокси...")
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(self.check_single_proxy, proxy): proxy
-                       for proxy in proxy_list}
-
-            completed = 0
-            for future in as_completed(futures):
-                result = future.result()
+        try:
+            async for result in self.iter_results(proxy_list):
                 results.append(result)
+                stream.write(result)
 
-                completed += 1
-                if completed % 10 == 0:
-                    print(f"[ProxyChecker] Проверено {completed}/{len(proxy_list)}")
+                if len(results) % 10 == 0:
+                    print(f"[ProxyChecker] Проверено {len(results)}/{len(proxy_list)}")
 
                 if result['status'] == 'WORKING':
                     self.working_proxies.append(result)
                     print(f"✅ РАБОЧИЙ: {result['proxy']} ({result['protocol']}) - {result['response_time']:.2f}s")
                 else:
                     self.failed_proxies.append(result)
+        finally:
+            stream.close()
 
         return results
 
-    def save_results(self, results, filename='proxy_results.csv'):
-        """Сохранение результатов в CSV"""
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['proxy', 'status', 'protocol', 'ip', 'response_time']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            writer.writeheader()
-            for result in results:
-                writer.writerow(result)
-
-        print(f"[ProxyChecker] Результаты сохранены в {filename}")
+    def check_proxy_list(self, proxy_list, csv_file=None, jsonl_file=None):
+        """Синхронная обертка над check_proxy_list_async"""
+        return asyncio.run(self.check_proxy_list_async(proxy_list, csv_file, jsonl_file))
 
     def save_working_proxies(self, filename='working_proxies.txt'):
         """Сохранение только рабочих прокси"""
         with open(filename, 'w') as f:
             for proxy in self.working_proxies:
-                f.write(f"{proxy['proxy']}\n")
+                # Схема нужна ProxyPool, чтобы SOCKS-прокси не использовались как HTTP
+                f.write(f"{proxy['protocol'].lower()}://{proxy['proxy']}\n")
 
         print(f"[ProxyChecker] Рабочие прокси сохранены в {filename}")
 
@@ -559,8 +643,8 @@ if __name__ == "__main__":
     # Создаем чекер
     checker = ProxyChecker()
 
-    # Проверяем все прокси
-    results = checker.check_proxy_list(proxies, max_workers=5)  # уменьшенное количество потоков
+    # Проверяем все прокси, результаты пишутся в файлы по мере готовности
+    results = checker.check_proxy_list(proxies, csv_file='proxy_results.csv', jsonl_file='proxy_results.jsonl')
 
     # Выводим статистику
     working_count = len(checker.working_proxies)
@@ -576,7 +660,6 @@ if __name__ == "__main__":
         for proxy in checker.working_proxies:
             print(f"  {proxy['proxy']} ({proxy['protocol']}) - {proxy['response_time']:.2f}s")
 
-    # Сохраняем результаты
-    checker.save_results(results)
+    # Сохраняем рабочие прокси
     if working_count > 0:
         checker.save_working_proxies()
@@ -0,0 +1,312 @@
+import json
+import os
+import random
+import threading
+import time
+
+from config import (
+    PROXY_HOST, PROXY_PORT, PROXY_USER, PROXY_PASS, PROXY_LIST, PROXY_FILE, PROXY_STATE_FILE
+)
+from metrics import METRICS
+
+
+class NoProxyError(RuntimeError):
+    """В пуле не осталось прокси, хотя они были настроены: без прокси не ходим"""
+
+
+class ProxyState:
+    """Прокси и статистика его работы"""
+
+    CLOSED = 'closed'  # Работает штатно
+    OPEN = 'open'  # Выведен из ротации до окончания cooldown
+    HALF_OPEN = 'half_open'  # Пробный запуск после cooldown
+
+    def __init__(self, host, port, username=None, password=None, scheme='http'):
+        self.host = host
+        self.port = str(port)
+        self.username = username
+        self.password = password
+        self.scheme = scheme
+
+        self.latency_ewma = None
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.blocks = 0
+        self.probe_failures = 0  # Подряд неудачных фоновых проверок
+        self.cooldown_until = 0
+        self.state = self.CLOSED
+        self.open_reason = None  # Кто вывел из ротации: 'failure', 'block' или 'probe'
+        self.pinned = False  # Прокси из конфигурации: из пула не удаляется
+
+    @property
+    def key(self):
+        return f"{self.host}:{self.port}"
+
+    @property
+    def url(self):
+        """URL прокси с авторизацией"""
+        if self.username and self.password:
+            return f"{self.scheme}://{self.username}:{self.password}@{self.host}:{self.port}"
+        return f"{self.scheme}://{self.host}:{self.port}"
+
+    @property
+    def success_rate(self):
+        # Сглаживание Лапласа, чтобы новый прокси не был ни идеальным, ни мертвым
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    def score(self):
+        """Вес при выборе: надежнее и быстрее — чаще"""
+        latency = self.latency_ewma if self.latency_ewma is not None else 1.0
+        weight = self.success_rate / max(latency, 0.05)
+        if self.state == self.HALF_OPEN:
+            weight *= 0.2
+        return weight
+
+    def to_dict(self):
+        return {
+            'latency_ewma': self.latency_ewma,
+            'successes': self.successes,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'blocks': self.blocks,
+            'probe_failures': self.probe_failures,
+            'cooldown_until': self.cooldown_until,
+            'state': self.state,
+            'open_reason': self.open_reason,
+        }
+
+    def load_dict(self, data):
+        for field, value in data.items():
+            if hasattr(self, field):
+                setattr(self, field, value)
+
+    def __repr__(self):
+        return f"<ProxyState {self.key} {self.state} score={self.score():.2f}>"
+
+
+class ProxyPool:
+    """Пул прокси с оценкой здоровья, circuit breaker и сохранением состояния"""
+
+    EWMA_ALPHA = 0.3
+    FAILURE_THRESHOLD = 3  # Подряд ошибок до вывода из ротации
+    FAILURE_COOLDOWN = 300  # 5 минут
+    BLOCK_COOLDOWN = 1800  # 30 минут, удваивается с каждой блокировкой
+    MAX_COOLDOWN = 6 * 3600
+    MAX_PROBE_FAILURES = 3  # Подряд проваленных фоновых проверок до удаления из пула
+    PROBE_DEAD_COOLDOWN = 3600  # Пауза для неудаляемого прокси после серии проваленных проверок
+    SAVE_INTERVAL = 30
+
+    def __init__(self, proxies=(), state_file=PROXY_STATE_FILE):
+        self.state_file = state_file
+        self.lock = threading.RLock()
+        self.proxies = {}
+        self.last_save = 0
+        # Пул, в котором были прокси, не отдает пустой выбор: трафик без прокси не пускаем
+        self.required = False
+
+        for proxy in proxies:
+            self.proxies[proxy.key] = proxy
+            self.required = True
+        self.load_state()
+
+    @classmethod
+    def from_config(cls):
+        """Пул из PROXY_LIST, PROXY_FILE и одиночного PROXY_HOST"""
+        lines = (PROXY_LIST or '').split(',')
+        if PROXY_FILE and os.path.exists(PROXY_FILE):
+            with open(PROXY_FILE) as f:
+                lines.extend(f.read().splitlines())
+
+        # PROXY_LIST и PROXY_HOST заданы вручную — такие прокси фоновая проверка не удаляет
+        pinned = {proxy.key for proxy in (cls.parse_proxy(line) for line in (PROXY_LIST or '').split(',')) if proxy}
+        proxies = [proxy for proxy in (cls.parse_proxy(line) for line in lines) if proxy]
+        if PROXY_HOST:
+            proxies.append(ProxyState(PROXY_HOST, PROXY_PORT, PROXY_USER, PROXY_PASS))
+            pinned.add(proxies[-1].key)
+
+        for proxy in proxies:
+            proxy.pinned = proxy.key in pinned
+
+        return cls(proxies)
+
+    @staticmethod
+    def parse_proxy(line):
+        """Разбор строки вида [scheme://][user:pass@]host:port"""
+        line = line.strip()
+        if not line or line.startswith('#'):
+            return None
+
+        scheme = 'http'
+        if '://' in line:
+            scheme, line = line.split('://', 1)
+
+        username = password = None
+        if '@' in line:
+            credentials, line = line.rsplit('@', 1)
+            username, _, password = credentials.partition(':')
+
+        host, _, port = line.rpartition(':')
+        if not host or not port:
+            return None
+
+        return ProxyState(host, port, username, password, scheme)
+
+    def __len__(self):
+        return len(self.proxies)
+
+    def add(self, proxy):
+        """Добавление прокси (или возврат уже известного с тем же адресом)"""
+        with self.lock:
+            self.required = True
+            return self.proxies.setdefault(proxy.key, proxy)
+
+    def remove(self, key):
+        with self.lock:
+            self.proxies.pop(key, None)
+
+    def snapshot(self):
+        """Копия текущего списка прокси для обхода из другого потока"""
+        with self.lock:
+            return list(self.proxies.values())
+
+    def is_available(self, proxy):
+        """Прокси все еще в пуле и не выведен из ротации"""
+        with self.lock:
+            self.refresh_states()
+            return self.proxies.get(proxy.key) is proxy and proxy.state != ProxyState.OPEN
+
+    def refresh_states(self, now=None):
+        """Перевод прокси с истекшим cooldown в пробный режим"""
+        now = now or time.time()
+        for proxy in self.proxies.values():
+            if proxy.state == ProxyState.OPEN and proxy.cooldown_until <= now:
+                proxy.state = ProxyState.HALF_OPEN
+
+    def choose(self):
+        """Взвешенный выбор здорового прокси; None — только если прокси не настроены вовсе"""
+        with self.lock:
+            if not self.proxies:
+                if self.required:
+                    raise NoProxyError("Пул прокси пуст")
+                return None
+
+            self.refresh_states()
+            available = [proxy for proxy in self.proxies.values() if proxy.state != ProxyState.OPEN]
+
+            if not available:
+                # Все выведены из ротации — берем тот, что освободится раньше всех
+                proxy = min(self.proxies.values(), key=lambda p: p.cooldown_until)
+                print(f"[ProxyPool] ⚠️ Все прокси на паузе, используем {proxy.key}")
+                return proxy
+
+            return random.choices(available, weights=[proxy.score() for proxy in available])[0]
+
+    def update_latency(self, proxy, latency):
+        if proxy.latency_ewma is None:
+            proxy.latency_ewma = latency
+        else:
+            proxy.latency_ewma = self.EWMA_ALPHA * latency + (1 - self.EWMA_ALPHA) * proxy.latency_ewma
+
+    def report_success(self, proxy, latency):
+        with self.lock:
+            self.update_latency(proxy, latency)
+            proxy.successes += 1
+            proxy.consecutive_failures = 0
+            proxy.probe_failures = 0
+            proxy.state = ProxyState.CLOSED
+            proxy.open_reason = None
+            self.save_state()
+
+    def report_probe_success(self, proxy, latency):
+        """Успешная фоновая проверка: возвращает в ротацию только выведенный проверками прокси
+
+        Проверка идет не на Avito, поэтому cooldown после блокировки или ошибок запросов не снимает.
+        """
+        with self.lock:
+            self.update_latency(proxy, latency)
+            proxy.probe_failures = 0
+            if proxy.state != ProxyState.CLOSED and proxy.open_reason == 'probe':
+                proxy.state = ProxyState.CLOSED
+                proxy.open_reason = None
+            self.save_state()
+
+    def report_failure(self, proxy):
+        METRICS.inc('proxy_failures')
+        with self.lock:
+            proxy.failures += 1
+            proxy.consecutive_failures += 1
+            if proxy.state == ProxyState.HALF_OPEN or proxy.consecutive_failures >= self.FAILURE_THRESHOLD:
+                self.open(proxy, self.FAILURE_COOLDOWN * proxy.consecutive_failures, 'failure')
+            self.save_state()
+
+    def report_block(self, proxy):
+        METRICS.inc('proxy_blocks')
+        with self.lock:
+            proxy.blocks += 1
+            proxy.failures += 1
+            self.open(proxy, self.BLOCK_COOLDOWN * 2 ** (proxy.blocks - 1), 'block')
+            self.save_state(force=True)
+
+    def report_probe_failure(self, proxy):
+        """Провал фоновой проверки: сразу выводим из ротации, после серии — удаляем
+
+        Прокси из конфигурации и последний прокси пула не удаляются: остаются на долгой паузе,
+        чтобы пул не опустел за время сбоя и трафик не пошел напрямую.
+        """
+        METRICS.inc('proxy_probe_failures')
+        with self.lock:
+            proxy.failures += 1
+            proxy.probe_failures += 1
+            removed = False
+            if proxy.probe_failures < self.MAX_PROBE_FAILURES:
+                if proxy.state != ProxyState.OPEN:
+                    self.open(proxy, self.FAILURE_COOLDOWN, 'probe')
+            elif proxy.pinned or len(self.proxies) <= 1:
+                if proxy.state != ProxyState.OPEN or proxy.open_reason == 'probe':
+                    self.open(proxy, self.PROBE_DEAD_COOLDOWN, 'probe')
+            else:
+                self.remove(proxy.key)
+                print(f"[ProxyPool] 🗑️ Прокси {proxy.key} удален: {proxy.probe_failures} проверок подряд без ответа")
+                removed = True
+            self.save_state()
+            return removed
+
+    def open(self, proxy, cooldown, reason='failure'):
+        proxy.state = ProxyState.OPEN
+        proxy.open_reason = reason
+        proxy.cooldown_until = time.time() + min(cooldown, self.MAX_COOLDOWN)
+        print(f"[ProxyPool] ⛔ Прокси {proxy.key} на паузе {min(cooldown, self.MAX_COOLDOWN) / 60:.0f} мин")
+
+    def open_count(self):
+        with self.lock:
+            self.refresh_states()
+            return sum(1 for proxy in self.proxies.values() if proxy.state == ProxyState.OPEN)
+
+    def load_state(self):
+        """Восстановление статистики после перезапуска"""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, encoding='utf-8') as f:
+                saved = json.load(f)
+            for key, data in saved.items():
+                if key in self.proxies:
+                    self.proxies[key].load_dict(data)
+        except Exception as e:
+            print(f"[ProxyPool] ⚠️ Ошибка загрузки состояния прокси: {e}")
+
+    def save_state(self, force=False):
+        """Сохранение статистики (не чаще раза в SAVE_INTERVAL секунд)"""
+        if not self.state_file or (not force and time.time() - self.last_save < self.SAVE_INTERVAL):
+            return
+        try:
+            with self.lock:
+                data = {key: proxy.to_dict() for key, proxy in self.proxies.items()}
+            tmp_file = f"{self.state_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.state_file)
+            self.last_save = time.time()
+        except Exception as e:
+            print(f"[ProxyPool] ⚠️ Ошибка сохранения состояния прокси: {e}")
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import threading
+import time
+
+from config import (
+    PROXY_FILE, PROXY_REVALIDATE_INTERVAL, PROXY_CHECK_URL, PROXY_CHECK_TIMEOUT, PROXY_CHECK_CONCURRENCY
+)
+from proxy import ProxyChecker
+from proxy_pool import ProxyPool
+
+
+class ProxyRevalidator:
+    """Фоновая перепроверка прокси пула с заменой списка на лету"""
+
+    def __init__(self, proxy_pool, interval=PROXY_REVALIDATE_INTERVAL, target_url=PROXY_CHECK_URL,
+                 timeout=PROXY_CHECK_TIMEOUT, concurrency=PROXY_CHECK_CONCURRENCY, proxy_file=PROXY_FILE):
+        self.proxy_pool = proxy_pool
+        self.interval = interval
+        self.proxy_file = proxy_file
+        self.proxy_file_mtime = None
+        self.checker = ProxyChecker(target_url=target_url, timeout=timeout, concurrency=concurrency)
+
+        self.thread = None
+        self.stopped = threading.Event()
+
+        self.rounds = 0
+        self.last_alive = 0
+        self.last_dead = 0
+
+    def start(self):
+        if self.interval <= 0 or (self.thread and self.thread.is_alive()):
+            return
+
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='proxy-revalidator', daemon=True)
+        self.thread.start()
+        print(f"[ProxyRevalidator] 🔁 Перепроверка прокси каждые {self.interval} с через {self.checker.target_url}")
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def run(self):
+        # Первый прогон сразу: мертвые прокси из файла не должны попасть в первый обход
+        while not self.stopped.is_set():
+            try:
+                self.revalidate()
+            except Exception as e:
+                print(f"[ProxyRevalidator] ❌ Ошибка перепроверки: {e}")
+            self.stopped.wait(self.interval)
+
+    def load_new_candidates(self):
+        """Новые прокси из PROXY_FILE, если файл обновлен с прошлого прогона"""
+        if not self.proxy_file or not os.path.exists(self.proxy_file):
+            return []
+
+        mtime = os.path.getmtime(self.proxy_file)
+        if mtime == self.proxy_file_mtime:
+            return []
+        first_read = self.proxy_file_mtime is None
+        self.proxy_file_mtime = mtime
+
+        # При первом чтении содержимое файла уже загружено ProxyPool.from_config
+        if first_read:
+            return []
+
+        with open(self.proxy_file) as f:
+            candidates = [ProxyPool.parse_proxy(line) for line in f.read().splitlines()]
+        return [proxy for proxy in candidates if proxy]
+
+    def revalidate(self):
+        """Один прогон: проверка всех прокси пула и новых кандидатов из файла"""
+        started = time.monotonic()
+        candidates = {proxy.key: proxy for proxy in self.proxy_pool.snapshot()}
+        for proxy in self.load_new_candidates():
+            candidates.setdefault(proxy.key, proxy)
+
+        if not candidates:
+            return
+
+        # ProxyChecker принимает адрес вида [user:pass@]host:port и сам подбирает протокол
+        by_address = {}
+        for proxy in candidates.values():
+            credentials = f"{proxy.username}:{proxy.password}@" if proxy.username and proxy.password else ''
+            by_address[f"{credentials}{proxy.key}"] = proxy
+
+        alive = dead = 0
+        for result in asyncio.run(self.collect(list(by_address))):
+            proxy = by_address[result['proxy']]
+            if result['status'] == 'WORKING':
+                proxy.scheme = result['protocol'].lower()
+                proxy = self.proxy_pool.add(proxy)
+                self.proxy_pool.report_probe_success(proxy, result['response_time'])
+                alive += 1
+            else:
+                if proxy.key in self.proxy_pool.proxies:
+                    self.proxy_pool.report_probe_failure(proxy)
+                dead += 1
+
+        self.rounds += 1
+        self.last_alive, self.last_dead = alive, dead
+        self.proxy_pool.save_state(force=True)
+        print(f"[ProxyRevalidator] ✅ Рабочих: {alive}, без ответа: {dead}, "
+              f"в пуле: {len(self.proxy_pool)} ({time.monotonic() - started:.1f} с)")
+
+    async def collect(self, addresses):
+        return [result async for result in self.checker.iter_results(addresses)]
@@ -0,0 +1,225 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import (
+    CHECK_INTERVAL, MIN_CHECK_INTERVAL, MAX_CHECK_INTERVAL, CHECK_JITTER,
+    NIGHT_HOURS, NIGHT_SLOWDOWN, REQUESTS_PER_PROXY_HOUR
+)
+
+
+class SearchSchedule:
+    """Расписание одного поиска и наблюдаемая частота новых объявлений"""
+
+    def __init__(self, name, interval, next_run):
+        self.name = name
+        self.interval = interval
+        self.next_run = next_run
+        self.last_run = None
+        self.rate = None  # Новых объявлений в час (EWMA)
+        self.blocks = 0
+        self.requests = 1  # Запросов страниц за последний проход — оценка стоимости следующего
+
+    def __repr__(self):
+        rate = f"{self.rate:.1f}/ч" if self.rate is not None else '?'
+        return f"<SearchSchedule {self.name} every {self.interval:.0f}s rate={rate}>"
+
+
+class RequestBudget:
+    """Бюджет запросов: ведро токенов, пополняемое пропорционально числу рабочих прокси"""
+
+    def __init__(self, per_proxy_hour, proxy_count):
+        self.per_proxy_hour = per_proxy_hour
+        self.proxy_count = proxy_count
+        self.tokens = self.capacity()
+        self.updated = time.time()
+
+    def capacity(self):
+        return self.per_proxy_hour * max(1, self.proxy_count())
+
+    def refill(self, now):
+        capacity = self.capacity()
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * capacity / 3600)
+        self.updated = now
+
+    def wait_time(self, cost, now):
+        """Через сколько секунд хватит токенов на cost запросов"""
+        self.refill(now)
+        cost = min(cost, self.capacity())
+        if self.tokens >= cost:
+            return 0
+        return (cost - self.tokens) * 3600 / self.capacity()
+
+    def charge(self, requests, now):
+        self.refill(now)
+        self.tokens -= requests
+
+
+class Job:
+    """Служебная задача: периодическая или ежедневная в заданное время"""
+
+    def __init__(self, func, interval=None, at=None):
+        self.func = func
+        self.interval = interval
+        self.at = at
+        self.next_run = self.schedule_next(time.time())
+
+    def schedule_next(self, now):
+        if self.interval:
+            return now + self.interval
+
+        hour, minute = map(int, self.at.split(':'))
+        run_at = datetime.fromtimestamp(now).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if run_at.timestamp() <= now:
+            run_at += timedelta(days=1)
+        return run_at.timestamp()
+
+
+class AdaptiveScheduler:
+    """Планировщик поисков: интервал по частоте новых объявлений, ночное и блокировочное замедление"""
+
+    EWMA_ALPHA = 0.3
+    TARGET_NEW_PER_CHECK = 1  # Стремимся к ~1 новому объявлению за проход
+    BLOCK_BACKOFF = 1800
+    MAX_BLOCK_BACKOFF = 6 * 3600
+    STARTUP_SPREAD = 30  # Первые проходы разносим на столько секунд
+    MAX_STEP_FACTOR = 2  # Интервал растет не больше чем вдвое за проход
+
+    def __init__(self, searches, proxy_count=lambda: 1, base_interval=CHECK_INTERVAL,
+                 min_interval=MIN_CHECK_INTERVAL, max_interval=MAX_CHECK_INTERVAL, jitter=CHECK_JITTER,
+                 night_hours=NIGHT_HOURS, night_slowdown=NIGHT_SLOWDOWN,
+                 requests_per_proxy_hour=REQUESTS_PER_PROXY_HOUR):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.base_interval = min(max(base_interval, self.min_interval), self.max_interval)
+        self.jitter = jitter
+        self.night_hours = self.parse_hours(night_hours)
+        self.night_slowdown = night_slowdown
+        self.budget = RequestBudget(requests_per_proxy_hour, proxy_count)
+
+        now = time.time()
+        self.searches = {
+            search['name']: SearchSchedule(search['name'], self.base_interval,
+                                           now + random.uniform(0, self.STARTUP_SPREAD) * (i > 0))
+            for i, search in enumerate(searches)
+        }
+        self.jobs = []
+        # Внешние события (например, остановка) будят ожидание раньше срока
+        self.wakeup = threading.Event()
+
+    @staticmethod
+    def parse_hours(value):
+        """'1-7' -> (1, 7); пустая строка — без ночного режима"""
+        if not value:
+            return None
+        start, _, end = value.partition('-')
+        return int(start), int(end or start)
+
+    def is_night(self, now):
+        if not self.night_hours:
+            return False
+        start, end = self.night_hours
+        hour = datetime.fromtimestamp(now).hour
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def every(self, seconds, func):
+        self.jobs.append(Job(func, interval=seconds))
+
+    def daily_at(self, at, func):
+        self.jobs.append(Job(func, at=at))
+
+    def prior_rate(self):
+        """Частота новых объявлений в час, соответствующая базовому интервалу"""
+        return 3600 * self.TARGET_NEW_PER_CHECK / self.base_interval
+
+    def next_interval(self, schedule, now):
+        """Интервал до следующего прохода поиска"""
+        if schedule.rate is None:
+            interval = self.base_interval
+        elif schedule.rate <= 0:
+            interval = self.max_interval
+        else:
+            interval = 3600 * self.TARGET_NEW_PER_CHECK / schedule.rate
+        # Один пустой проход не должен сразу отправлять поиск на max_interval
+        interval = min(interval, schedule.interval * self.MAX_STEP_FACTOR)
+        interval = min(max(interval, self.min_interval), self.max_interval)
+
+        if self.is_night(now):
+            interval *= self.night_slowdown
+
+        if schedule.blocks:
+            backoff = self.BLOCK_BACKOFF * 2 ** (schedule.blocks - 1)
+            interval = max(interval, min(backoff, self.MAX_BLOCK_BACKOFF))
+
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def record(self, name, new_count, requests=1, blocked=False, now=None):
+        """Учет результата прохода и планирование следующего"""
+        now = now or time.time()
+        schedule = self.searches[name]
+        self.budget.charge(requests, now)
+
+        if blocked:
+            schedule.blocks += 1
+        else:
+            schedule.blocks = 0
+            schedule.requests = max(1, requests)
+            if schedule.last_run is not None:
+                elapsed_hours = max(now - schedule.last_run, 1) / 3600
+                observed = new_count / elapsed_hours
+                # Начальная оценка — частота, при которой базовый интервал дает TARGET_NEW_PER_CHECK,
+                # поэтому первый проход без новых объявлений не обнуляет ее
+                rate = schedule.rate if schedule.rate is not None else self.prior_rate()
+                schedule.rate = self.EWMA_ALPHA * observed + (1 - self.EWMA_ALPHA) * rate
+            schedule.last_run = now
+
+        schedule.interval = self.next_interval(schedule, now)
+        schedule.next_run = now + schedule.interval
+
+    def run_jobs(self, now):
+        for job in self.jobs:
+            if job.next_run <= now:
+                try:
+                    job.func()
+                except Exception as e:
+                    print(f"[Scheduler] ❌ Ошибка задачи {job.func.__name__}: {e}")
+                job.next_run = job.schedule_next(time.time())
+
+    def due(self, now):
+        """Поиски, которым пора и на которые хватает бюджета запросов"""
+        due = []
+        cost = 0
+        for schedule in sorted(self.searches.values(), key=lambda s: s.next_run):
+            if schedule.next_run > now:
+                break
+            wait = self.budget.wait_time(cost + schedule.requests, now)
+            if wait > 0:
+                # Бюджет исчерпан — сдвигаем поиск, не увеличивая общий объем запросов
+                schedule.next_run = now + wait
+                continue
+            cost += schedule.requests
+            due.append(schedule.name)
+        return due
+
+    def wait_due(self):
+        """Ожидание до ближайшего прохода; служебные задачи выполняются по пути"""
+        while True:
+            now = time.time()
+            self.run_jobs(now)
+
+            due = self.due(now)
+            if due:
+                return due
+
+            next_run = min(
+                [schedule.next_run for schedule in self.searches.values()] +
+                [job.next_run for job in self.jobs]
+            )
+            self.wakeup.wait(max(next_run - time.time(), 0.1))
+            self.wakeup.clear()
+
+    def stats(self):
+        return {name: repr(schedule) for name, schedule in self.searches.items()}
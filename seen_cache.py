@@ -0,0 +1,97 @@
+import hashlib
+import math
+from collections import OrderedDict
+
+
+class BloomFilter:
+    """Компактный фильтр Блума для быстрой проверки «точно не встречали»"""
+
+    def __init__(self, capacity=100000, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        """Позиции битов для ключа (двойное хеширование)"""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class SeenCache:
+    """Кэш уже встреченных объявлений перед ApartmentDB: точный LRU + фильтр Блума"""
+
+    SEEN = True
+    NEW = False
+    UNKNOWN = None
+
+    def __init__(self, lru_size=10000, bloom_capacity=100000, error_rate=0.01):
+        self.lru_size = lru_size
+        self.bloom_capacity = bloom_capacity
+        self.error_rate = error_rate
+        self.recent = OrderedDict()
+        self.bloom = BloomFilter(bloom_capacity, error_rate)
+
+        self.hits = 0
+        self.bloom_negatives = 0
+        self.misses = 0
+
+    def lookup(self, keys):
+        """SEEN — точно есть в базе, NEW — точно нет, UNKNOWN — нужен запрос в базу"""
+        keys = [key for key in keys if key]
+
+        for key in keys:
+            if key in self.recent:
+                self.recent.move_to_end(key)
+                self.hits += 1
+                return self.SEEN
+
+        if not any(key in self.bloom for key in keys):
+            self.bloom_negatives += 1
+            return self.NEW
+
+        self.misses += 1
+        return self.UNKNOWN
+
+    def remember(self, keys):
+        """Отметить ключи как уже сохраненные в базе"""
+        for key in keys:
+            if not key:
+                continue
+            if key not in self.recent and key not in self.bloom:
+                self.bloom.add(key)
+            self.recent[key] = True
+            self.recent.move_to_end(key)
+
+        while len(self.recent) > self.lru_size:
+            self.recent.popitem(last=False)
+
+    def rebuild(self, keys):
+        """Пересборка фильтра по актуальному содержимому базы"""
+        keys = [key for key in keys if key]
+        self.recent.clear()
+        self.bloom = BloomFilter(max(self.bloom_capacity, len(keys) * 2), self.error_rate)
+        for key in keys:
+            self.bloom.add(key)
+
+    def stats(self):
+        """Счетчики попаданий и промахов"""
+        return {
+            'hits': self.hits,
+            'bloom_negatives': self.bloom_negatives,
+            'misses': self.misses,
+            'recent_size': len(self.recent),
+            'bloom_size': self.bloom.count,
+        }
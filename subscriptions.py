@@ -0,0 +1,351 @@
+import argparse
+import json
+import threading
+import time
+from collections import namedtuple
+
+from config import TARGET_METRO_STATIONS, FILTER_CRITERIA
+from metrics import METRICS
+from metro import StationMatcher
+
+Subscriber = namedtuple('Subscriber', [
+    'id', 'chat_id', 'name', 'max_price', 'min_area', 'max_metro_time', 'rooms', 'stations', 'searches'
+])
+
+
+def iter_bits(bits):
+    """Номера установленных битов (позиции подписчиков в индексе)"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class SubscriptionIndex:
+    """Инвертированный индекс профилей подписчиков по станции, числу комнат и ценовой корзине
+
+    Каждому значению соответствует битовая маска подписчиков (int), кандидаты для объявления —
+    пересечение масок, поэтому подбор почти не зависит от числа подписчиков. Границы корзин
+    и площадь/время до метро проверяются точно только у кандидатов.
+    """
+
+    PRICE_BUCKET = 5000
+
+    def __init__(self, subscribers):
+        self.subscribers = list(subscribers)
+        self.all_bits = (1 << len(self.subscribers)) - 1
+
+        self.by_station = {}
+        self.by_rooms = {}
+        self.any_rooms = 0
+        self.by_search = {}
+        self.any_search = 0
+        self.no_price_limit = 0
+        limited = []
+
+        for position, subscriber in enumerate(self.subscribers):
+            bit = 1 << position
+            for station in subscriber.stations:
+                self.by_station[station] = self.by_station.get(station, 0) | bit
+
+            if subscriber.rooms is None:
+                self.any_rooms |= bit
+            else:
+                for rooms in subscriber.rooms:
+                    self.by_rooms[rooms] = self.by_rooms.get(rooms, 0) | bit
+
+            if subscriber.searches is None:
+                self.any_search |= bit
+            else:
+                for search in subscriber.searches:
+                    self.by_search[search] = self.by_search.get(search, 0) | bit
+
+            if subscriber.max_price is None:
+                self.no_price_limit |= bit
+            else:
+                limited.append((subscriber.max_price, bit))
+
+        # Корзина k: подписчики, чей потолок цены не ниже k * PRICE_BUCKET (накопительно сверху)
+        bucket_count = max((price for price, _ in limited), default=0) // self.PRICE_BUCKET + 1
+        self.price_buckets = [0] * bucket_count
+        for price, bit in limited:
+            self.price_buckets[price // self.PRICE_BUCKET] |= bit
+        for k in range(bucket_count - 2, -1, -1):
+            self.price_buckets[k] |= self.price_buckets[k + 1]
+
+        self.matcher = StationMatcher(self.by_station)
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def station_bits(self, apartment):
+        """Подписчики станций объявления; без станций в карточке — станций из текста"""
+        stations = apartment.metro_stations
+        if not stations:
+            stations = [match.station for match in self.matcher.finditer(apartment.full_text)]
+
+        bits = 0
+        for station in stations:
+            bits |= self.by_station.get(station, 0)
+        return bits
+
+    def candidates(self, apartment):
+        """Маска подписчиков, прошедших индекс (станция, комнаты, ценовая корзина, поиск)"""
+        bits = self.all_bits
+
+        searches = apartment.searches or [apartment.search]
+        if any(searches):
+            search_bits = self.any_search
+            for search in searches:
+                search_bits |= self.by_search.get(search, 0)
+            bits &= search_bits
+
+        # Студия или неизвестное число комнат проходит любой профиль, как и в meets_criteria
+        if bits and apartment.rooms:
+            bits &= self.any_rooms | self.by_rooms.get(apartment.rooms, 0)
+
+        price = apartment.price_num
+        if bits and price:
+            bucket = int(price // self.PRICE_BUCKET)
+            bits &= self.no_price_limit | (self.price_buckets[bucket] if bucket < len(self.price_buckets) else 0)
+
+        if bits:
+            bits &= self.station_bits(apartment)
+        return bits
+
+    def accepts(self, subscriber, apartment):
+        """Точная проверка кандидата: правила meets_criteria"""
+        price = apartment.price_num
+        if price and subscriber.max_price is not None and price > subscriber.max_price:
+            return False
+
+        area = apartment.area
+        if area and subscriber.min_area is not None and area < subscriber.min_area:
+            return False
+
+        metro_time = apartment.metro_time
+        if metro_time and subscriber.max_metro_time is not None and metro_time > subscriber.max_metro_time:
+            return False
+
+        return True
+
+    def match(self, apartment):
+        """Подписчики, которым подходит объявление"""
+        try:
+            return [self.subscribers[position] for position in iter_bits(self.candidates(apartment))
+                    if self.accepts(self.subscribers[position], apartment)]
+        except Exception as e:
+            print(f"[Subscriptions] ❌ Ошибка подбора подписчиков: {e}")
+            return []
+
+
+class SubscriptionManager:
+    """Подписчики с собственными фильтрами в базе и раздача им объявлений через индекс"""
+
+    def __init__(self, db):
+        self.db = db
+        self.index_lock = threading.Lock()
+        self.index = None
+        self.init_tables()
+        self.rebuild_index()
+
+    def init_tables(self):
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute('''
+                CREATE TABLE IF NOT EXISTS subscribers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id TEXT NOT NULL,
+                    name TEXT NOT NULL DEFAULT 'default',
+                    max_price INTEGER,
+                    min_area REAL,
+                    max_metro_time INTEGER,
+                    rooms TEXT,
+                    stations TEXT,
+                    searches TEXT,
+                    active INTEGER DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (chat_id, name)
+                )
+            ''')
+
+    @staticmethod
+    def profile_row(criteria, searches=None):
+        """Колонки профиля из словаря фильтра (формат FILTER_CRITERIA)"""
+        rooms = criteria.get('rooms')
+        stations = criteria.get('stations')
+        return (
+            criteria.get('max_price'),
+            criteria.get('min_area'),
+            criteria.get('max_metro_time'),
+            json.dumps(sorted(rooms)) if rooms is not None else None,
+            json.dumps(sorted(StationMatcher.normalize(s) for s in stations), ensure_ascii=False) if stations else None,
+            json.dumps(sorted(searches), ensure_ascii=False) if searches else None,
+        )
+
+    def subscribe(self, chat_id, criteria=None, name='default', searches=None):
+        """Добавление или обновление профиля подписчика (повторная подписка включает его снова)"""
+        criteria = {**FILTER_CRITERIA, **(criteria or {})}
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute('''
+                INSERT INTO subscribers
+                (chat_id, name, max_price, min_area, max_metro_time, rooms, stations, searches, active)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+                ON CONFLICT(chat_id, name) DO UPDATE SET
+                    max_price = excluded.max_price,
+                    min_area = excluded.min_area,
+                    max_metro_time = excluded.max_metro_time,
+                    rooms = excluded.rooms,
+                    stations = excluded.stations,
+                    searches = excluded.searches,
+                    active = 1
+            ''', (str(chat_id), name, *self.profile_row(criteria, searches)))
+        self.rebuild_index()
+
+    def unsubscribe(self, chat_id, name=None):
+        """Отключение профиля (или всех профилей чата); запись остается, чтобы посев ее не вернул"""
+        with self.db.lock, self.db.conn:
+            if name is None:
+                cursor = self.db.conn.execute('UPDATE subscribers SET active = 0 WHERE chat_id = ?', (str(chat_id),))
+            else:
+                cursor = self.db.conn.execute(
+                    'UPDATE subscribers SET active = 0 WHERE chat_id = ? AND name = ?', (str(chat_id), name)
+                )
+        self.rebuild_index()
+        return cursor.rowcount
+
+    def seed(self, searches):
+        """Профили из поисков конфигурации (TELEGRAM_CHAT_ID и FILTER_CRITERIA)
+
+        Фильтр обновляется при каждом запуске, чтобы правки конфигурации доходили до базы;
+        флаг active не трогаем — отписка остается в силе.
+        """
+        rows = [
+            (str(search['chat_id']), search['name'], *self.profile_row(search['filter'], [search['name']]))
+            for search in searches if search.get('chat_id')
+        ]
+        if not rows:
+            return 0
+
+        with self.db.lock, self.db.conn:
+            cursor = self.db.conn.executemany('''
+                INSERT INTO subscribers
+                (chat_id, name, max_price, min_area, max_metro_time, rooms, stations, searches)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(chat_id, name) DO UPDATE SET
+                    max_price = excluded.max_price,
+                    min_area = excluded.min_area,
+                    max_metro_time = excluded.max_metro_time,
+                    rooms = excluded.rooms,
+                    stations = excluded.stations,
+                    searches = excluded.searches
+            ''', rows)
+        if cursor.rowcount > 0:
+            print(f"[Subscriptions] 🌱 Профилей из конфигурации: {cursor.rowcount}")
+        self.rebuild_index()
+        return cursor.rowcount
+
+    def load(self):
+        """Активные профили из базы"""
+        with self.db.lock:
+            cursor = self.db.conn.execute('''
+                SELECT id, chat_id, name, max_price, min_area, max_metro_time, rooms, stations, searches
+                FROM subscribers WHERE active = 1 ORDER BY id
+            ''')
+            rows = cursor.fetchall()
+
+        subscribers = []
+        for row_id, chat_id, name, max_price, min_area, max_metro_time, rooms, stations, searches in rows:
+            subscribers.append(Subscriber(
+                row_id, chat_id, name, max_price, min_area, max_metro_time,
+                frozenset(json.loads(rooms)) if rooms is not None else None,
+                frozenset(json.loads(stations)) if stations else frozenset(TARGET_METRO_STATIONS),
+                frozenset(json.loads(searches)) if searches else None,
+            ))
+        return subscribers
+
+    def rebuild_index(self):
+        index = SubscriptionIndex(self.load())
+        # Готовый индекс подменяется целиком: воркеры не видят его наполовину собранным
+        with self.index_lock:
+            self.index = index
+
+    def profiles(self, search=None):
+        """Фильтры активных подписчиков поиска в формате FILTER_CRITERIA (для BatchFilter)"""
+        return [
+            {key: value for key, value in (
+                ('max_price', subscriber.max_price),
+                ('min_area', subscriber.min_area),
+                ('max_metro_time', subscriber.max_metro_time),
+                ('rooms', subscriber.rooms),
+                ('stations', subscriber.stations),
+            ) if value is not None}
+            for subscriber in self.index.subscribers
+            if subscriber.searches is None or search in subscriber.searches
+        ]
+
+    def match(self, apartment):
+        """Подписчики, которым подходит объявление"""
+        return self.index.match(apartment)
+
+    def chat_ids(self, apartment):
+        """Чаты подписчиков объявления без повторов (у чата может быть несколько профилей)"""
+        return list(dict.fromkeys(subscriber.chat_id for subscriber in self.match(apartment)))
+
+    def assign(self, apartments):
+        """Проставляет chat_ids каждому объявлению выдачи"""
+        started = time.perf_counter()
+        matched = 0
+        for apartment in apartments:
+            apartment.chat_ids = self.chat_ids(apartment)
+            matched += len(apartment.chat_ids)
+
+        METRICS.observe('subscriptions', time.perf_counter() - started)
+        METRICS.inc('subscriber_matches', matched)
+        return apartments
+
+    def __len__(self):
+        return len(self.index)
+
+
+if __name__ == "__main__":
+    from database import ApartmentDB
+
+    parser = argparse.ArgumentParser(description='Подписчики и их фильтры')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='Активные подписчики')
+
+    add = commands.add_parser('add', help='Добавить или обновить профиль')
+    add.add_argument('chat_id')
+    add.add_argument('--name', default='default', help='Имя профиля (у чата их может быть несколько)')
+    add.add_argument('--max-price', type=int)
+    add.add_argument('--min-area', type=float)
+    add.add_argument('--max-metro-time', type=int)
+    add.add_argument('--rooms', help='Число комнат через запятую: 1,2')
+    add.add_argument('--stations', help='Станции через запятую (по умолчанию — целевые станции)')
+    add.add_argument('--searches', help='Только для этих поисков (имена через запятую)')
+
+    remove = commands.add_parser('remove', help='Отключить профиль или все профили чата')
+    remove.add_argument('chat_id')
+    remove.add_argument('--name')
+
+    args = parser.parse_args()
+    manager = SubscriptionManager(ApartmentDB())
+
+    if args.command == 'add':
+        criteria = {key: value for key, value in (
+            ('max_price', args.max_price),
+            ('min_area', args.min_area),
+            ('max_metro_time', args.max_metro_time),
+            ('rooms', [int(r) for r in args.rooms.split(',')] if args.rooms else None),
+            ('stations', [s.strip() for s in args.stations.split(',')] if args.stations else None),
+        ) if value is not None}
+        searches = [s.strip() for s in args.searches.split(',')] if args.searches else None
+        manager.subscribe(args.chat_id, criteria, args.name, searches)
+        print(f"✅ Профиль {args.name} для чата {args.chat_id} сохранен")
+    elif args.command == 'remove':
+        print(f"🗑️ Отключено профилей: {manager.unsubscribe(args.chat_id, args.name)}")
+
+    for subscriber in manager.index.subscribers:
+        rooms = ','.join(map(str, sorted(subscriber.rooms))) if subscriber.rooms is not None else 'любые'
+        print(f"  {subscriber.chat_id} [{subscriber.name}]: до {subscriber.max_price} ₽, от {subscriber.min_area} м², "
+              f"комнат {rooms}, до метро {subscriber.max_metro_time} мин, станций {len(subscriber.stations)}")
@@ -1,5 +1,9 @@
 import requests
-from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, FILTER_CRITERIA
+from config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, FILTER_CRITERIA, RING_METRO_STATIONS,
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE, TELEGRAM_MEDIA_GROUP_SIZE
+)
+from telegram_queue import TelegramDeliveryQueue
 
 
 class TelegramBot:
@@ -7,71 +11,134 @@ class TelegramBot:
         self.token = TELEGRAM_BOT_TOKEN
         self.chat_id = TELEGRAM_CHAT_ID
         self.base_url = f"https://api.telegram.org/bot{self.token}"
-
-    def send_apartment_notification(self, apartment_data):
-        """Отправка уведомления о новой квартире"""
+        self.session = requests.Session()
+
+        # Уведомления о квартирах уходят через фоновую очередь, не блокируя парсинг
+        self.delivery = TelegramDeliveryQueue(
+            self.base_url,
+            global_rate=TELEGRAM_GLOBAL_RATE,
+            chat_rate=TELEGRAM_CHAT_RATE,
+            group_rate=TELEGRAM_GROUP_RATE,
+            media_group_size=TELEGRAM_MEDIA_GROUP_SIZE
+        )
+
+    def send_apartment_notification(self, apartment, chat_id=None):
+        """Постановка уведомления о новой квартире в очередь отправки"""
+        self.send_apartment_notifications(apartment, [chat_id or self.chat_id])
+
+    def send_apartment_notifications(self, apartment, chat_ids):
+        """Рассылка одной квартиры подписчикам: сообщение форматируется один раз на все чаты"""
         try:
-            message = self.format_apartment_message(apartment_data)
+            message = self.format_apartment_message(apartment)
+
+            for chat_id in chat_ids:
+                if apartment.image_url:
+                    self.delivery.enqueue(chat_id, 'sendPhoto', {
+                        'chat_id': chat_id,
+                        'photo': apartment.image_url,
+                        'caption': message[:1024],
+                        'parse_mode': 'Markdown'
+                    })
+                else:
+                    self.delivery.enqueue(chat_id, 'sendMessage', {
+                        'chat_id': chat_id,
+                        'text': message[:4096],
+                        'parse_mode': 'Markdown',
+                        'disable_web_page_preview': False
+                    })
 
-            if apartment_data['image_url']:
-                self.send_photo_with_caption(apartment_data['image_url'], message)
-            else:
-                self.send_message(message)
+        except Exception as e:
+            print(f"Ошибка при отправке уведомления: {e}")
 
+    def send_listing_event_notification(self, event, chat_id=None):
+        """Короткое уведомление о снижении цены или повторной публикации"""
+        try:
+            message = self.format_listing_event_message(event)
+            chat_id = chat_id or self.chat_id
+            self.delivery.enqueue(chat_id, 'sendMessage', {
+                'chat_id': chat_id,
+                'text': message[:4096],
+                'parse_mode': 'Markdown',
+                'disable_web_page_preview': True
+            })
         except Exception as e:
             print(f"Ошибка при отправке уведомления: {e}")
 
-    def format_apartment_message(self, apartment_data):
-        """Форматирование сообщения о квартире"""
+    def format_listing_event_message(self, event):
+        """Форматирование сообщения об изменении объявления"""
+        apartment = event.apartment
+        metro_text = self.format_metro_info(apartment.metro_stations, apartment.metro_time)
+
+        if event.kind == 'price_down':
+            header = "📉 **ЦЕНА СНИЖЕНА!**"
+        elif event.kind == 'price_up':
+            header = "📈 **Цена выросла**"
+        else:
+            header = "🔁 **СНОВА В ПРОДАЖЕ**"
+
+        price_text = apartment.price
+        if event.old_price and event.new_price and event.old_price != event.new_price:
+            diff = event.new_price - event.old_price
+            price_text = f"{event.old_price:,} → {event.new_price:,} ₽ ({diff:+,} ₽)".replace(',', ' ')
+
+        message = f"""
+{header}
+
+🏠 **{apartment.title}**
 
-        quality_emoji = self.get_quality_emoji(apartment_data)
-        metro_text = self.format_metro_info(apartment_data['metro_info'])
-        repair_info = self.check_repair_quality(apartment_data['title'], apartment_data['description'])
+💰 **Цена:** {price_text}
+🚇 **Метро:** {metro_text}
+📍 **Адрес:** {apartment.location}
 
-        # Отображаем возраст объявления
-        listing_age = apartment_data.get('listing_age', '📅 Недавно')
+🔗 [**ПОСМОТРЕТЬ ОБЪЯВЛЕНИЕ**]({apartment.url})
+        """
+        return message.strip()
+
+    def format_apartment_message(self, apartment):
+        """Форматирование сообщения о квартире"""
+
+        quality_emoji = self.get_quality_emoji(apartment)
+        metro_text = self.format_metro_info(apartment.metro_stations, apartment.metro_time)
+        repair_info = self.check_repair_quality(apartment.title, apartment.description)
 
         message = f"""
 {quality_emoji} **НОВАЯ КВАРТИРА НАЙДЕНА!**
 
-{listing_age}
+📅 Недавно
 
-🏠 **{apartment_data['title']}**
+🏠 **{apartment.title}**
 
-💰 **Цена:** {apartment_data['price']}
-📏 **Площадь:** {apartment_data.get('area', 'не указана')} м²
+💰 **Цена:** {apartment.price}
+📏 **Площадь:** {apartment.area or 'не указана'} м²
 🚇 **Метро:** {metro_text}
-📍 **Адрес:** {apartment_data['location']}
+📍 **Адрес:** {apartment.location}
 
 {repair_info}
 
 📝 **Описание:** 
-{apartment_data['description'][:300]}{'...' if len(apartment_data['description']) > 300 else ''}
+{apartment.description[:300]}{'...' if len(apartment.description) > 300 else ''}
 
-🔗 [**ПОСМОТРЕТЬ ОБЪЯВЛЕНИЕ**]({apartment_data['url']})
+🔗 [**ПОСМОТРЕТЬ ОБЪЯВЛЕНИЕ**]({apartment.url})
 
 ⚡ *Быстрее пишите продавцу!*
         """
         return message.strip()
 
-    def get_quality_emoji(self, apartment_data):
+    def get_quality_emoji(self, apartment):
         """Определение качества предложения"""
         score = 0
 
-        text = (apartment_data['title'] + ' ' + apartment_data['description']).lower()
+        text = (apartment.title + ' ' + apartment.description).lower()
         if any(repair in text for repair in FILTER_CRITERIA['preferred_repair']):
             score += 2
 
-        koltso_stations = {'киевская', 'парк культуры', 'октябрьская', 'добрынинская',
-                           'павелецкая', 'таганская', 'курская', 'комсомольская',
-                           'проспект мира', 'новослободская', 'белорусская', 'краснопресненская'}
-        if any(station in koltso_stations for station in apartment_data['metro_info']['stations']):
+        if any(station in RING_METRO_STATIONS for station in apartment.metro_stations):
             score += 2
 
-        if apartment_data['metro_info']['time'] and apartment_data['metro_info']['time'] <= 10:
+        if apartment.metro_time and apartment.metro_time <= 10:
             score += 1
 
-        if apartment_data['price_num'] and apartment_data['price_num'] < 60000:
+        if apartment.price_num and apartment.price_num < 60000:
             score += 1
 
         if score >= 4:
@@ -81,16 +148,16 @@ class TelegramBot:
         else:
             return "🏠"
 
-    def format_metro_info(self, metro_info):
+    def format_metro_info(self, stations, metro_time):
         """Форматирование информации о метро"""
-        if not metro_info['stations']:
+        if not stations:
             return "Не указано"
 
-        stations_text = ", ".join(metro_info['stations'][:3])
-        if len(metro_info['stations']) > 3:
-            stations_text += f" и еще {len(metro_info['stations']) - 3}"
+        stations_text = ", ".join(stations[:3])
+        if len(stations) > 3:
+            stations_text += f" и еще {len(stations) - 3}"
 
-        time_text = f" ({metro_info['time']} мин)" if metro_info['time'] else ""
+        time_text = f" ({metro_time} мин)" if metro_time else ""
 
         return f"{stations_text}{time_text}"
 
@@ -118,7 +185,7 @@ class TelegramBot:
             'parse_mode': 'Markdown'
         }
 
-        response = requests.post(url, json=payload)
+        response = self.session.post(url, json=payload, timeout=30)
         return response.json()
 
     def send_message(self, text):
@@ -132,10 +199,14 @@ class TelegramBot:
             'disable_web_page_preview': False
         }
 
-        response = requests.post(url, json=payload)
+        response = self.session.post(url, json=payload, timeout=30)
         return response.json()
 
     def send_status_message(self, status):
         """Отправка статусного сообщения"""
         message = f"🤖 Статус бота: {status}"
         self.send_message(message)
+
+    def close(self, timeout=30):
+        """Дождаться отправки очереди уведомлений"""
+        self.delivery.stop(timeout)
@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+from collections import deque, namedtuple
+
+import aiohttp
+
+from metrics import METRICS
+
+Notification = namedtuple('Notification', ['chat_id', 'method', 'payload'])
+
+
+class RateLimiter:
+    """Скользящее окно: не более rate событий за per секунд"""
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.events = deque()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            while self.events and now - self.events[0] >= self.per:
+                self.events.popleft()
+
+            if len(self.events) < self.rate:
+                self.events.append(now)
+                return
+
+            await asyncio.sleep(self.per - (now - self.events[0]))
+
+
+class TelegramDeliveryQueue:
+    """Асинхронная очередь отправки в Telegram с учетом лимитов API"""
+
+    MEDIA_GROUP_LIMIT = 10  # Ограничение Telegram на sendMediaGroup
+
+    def __init__(self, base_url, global_rate=30, chat_rate=1, group_rate=20, media_group_size=1):
+        self.base_url = base_url
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.media_group_size = max(1, min(media_group_size, self.MEDIA_GROUP_LIMIT))
+
+        self.loop = None
+        self.thread = None
+        self.session = None
+        self.queue = None
+        self.chat_queues = {}
+        self.chat_limiters = {}
+        self.global_limiter = None
+        self.ready = threading.Event()
+
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+
+    def start(self):
+        """Запуск цикла событий в фоновом потоке"""
+        if self.thread and self.thread.is_alive():
+            return
+
+        self.ready.clear()
+        self.thread = threading.Thread(target=self.run_loop, name='telegram-delivery', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.queue = asyncio.Queue()
+        self.global_limiter = RateLimiter(self.global_rate, 1)
+        self.loop.create_task(self.dispatch())
+        self.ready.set()
+        self.loop.run_forever()
+
+    def enqueue(self, chat_id, method, payload):
+        """Постановка сообщения в очередь (потокобезопасно, не блокирует)"""
+        self.start()
+        notification = Notification(str(chat_id), method, payload)
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, notification)
+
+    def pending(self):
+        """Количество сообщений, ожидающих отправки"""
+        if not self.queue:
+            return 0
+        return self.queue.qsize() + sum(queue.qsize() for queue in self.chat_queues.values())
+
+    def stop(self, timeout=30):
+        """Дождаться отправки очереди и остановить поток"""
+        if not self.thread or not self.thread.is_alive():
+            return
+
+        future = asyncio.run_coroutine_threadsafe(self.drain(), self.loop)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            print(f"[TelegramQueue] ⚠️ Очередь не отправлена полностью: {e}")
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+    async def drain(self):
+        await self.queue.join()
+        for queue in list(self.chat_queues.values()):
+            await queue.join()
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.global_rate, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self.session
+
+    async def dispatch(self):
+        """Раскладка сообщений по очередям чатов, у каждого чата свой воркер"""
+        while True:
+            notification = await self.queue.get()
+            try:
+                chat_queue = self.chat_queues.get(notification.chat_id)
+                if chat_queue is None:
+                    chat_queue = self.chat_queues[notification.chat_id] = asyncio.Queue()
+                    self.loop.create_task(self.chat_worker(notification.chat_id, chat_queue))
+                chat_queue.put_nowait(notification)
+            finally:
+                self.queue.task_done()
+
+    def chat_limiter(self, chat_id):
+        limiter = self.chat_limiters.get(chat_id)
+        if limiter is None:
+            # В группах (отрицательный chat_id) Telegram разрешает ~20 сообщений в минуту
+            if chat_id.startswith('-'):
+                limiter = RateLimiter(self.group_rate, 60)
+            else:
+                limiter = RateLimiter(self.chat_rate, 1)
+            self.chat_limiters[chat_id] = limiter
+        return limiter
+
+    async def chat_worker(self, chat_id, chat_queue):
+        carry = None
+        while True:
+            batch = [carry or await chat_queue.get()]
+            carry = None
+
+            # Фото, накопившиеся в очереди чата, отправляем одним альбомом
+            if batch[0].method == 'sendPhoto' and self.media_group_size > 1:
+                while len(batch) < self.media_group_size and not chat_queue.empty():
+                    notification = chat_queue.get_nowait()
+                    if notification.method != 'sendPhoto':
+                        carry = notification
+                        break
+                    batch.append(notification)
+
+            try:
+                if len(batch) > 1:
+                    await self.send_media_group(chat_id, batch)
+                else:
+                    await self.send_with_fallback(batch[0])
+            except Exception as e:
+                self.failed += len(batch)
+                METRICS.inc('telegram_failed', len(batch))
+                print(f"[TelegramQueue] ❌ Ошибка отправки в чат {chat_id}: {e}")
+            finally:
+                for _ in batch:
+                    chat_queue.task_done()
+
+    async def send_media_group(self, chat_id, batch):
+        media = []
+        for notification in batch:
+            media.append({
+                'type': 'photo',
+                'media': notification.payload['photo'],
+                'caption': notification.payload.get('caption', ''),
+                'parse_mode': notification.payload.get('parse_mode', 'Markdown'),
+            })
+
+        result = await self.call(chat_id, 'sendMediaGroup', {'chat_id': chat_id, 'media': media})
+        if result.get('ok'):
+            self.sent += len(batch)
+            METRICS.inc('telegram_sent', len(batch))
+            return
+
+        # Альбом не принят (например, битая ссылка на фото) — шлем по одному
+        for notification in batch:
+            await self.send_with_fallback(notification)
+
+    async def send_with_fallback(self, notification):
+        result = await self.call(notification.chat_id, notification.method, notification.payload)
+        if not result.get('ok') and notification.method == 'sendPhoto':
+            payload = notification.payload
+            result = await self.call(notification.chat_id, 'sendMessage', {
+                'chat_id': payload['chat_id'],
+                'text': payload.get('caption', ''),
+                'parse_mode': payload.get('parse_mode', 'Markdown'),
+            })
+
+        if result.get('ok'):
+            self.sent += 1
+            METRICS.inc('telegram_sent')
+        else:
+            self.failed += 1
+            METRICS.inc('telegram_failed')
+            print(f"[TelegramQueue] ⚠️ Telegram отклонил сообщение: {result.get('description')}")
+
+    async def call(self, chat_id, method, payload, max_attempts=5):
+        """Вызов метода Bot API с учетом лимитов и retry_after"""
+        session = await self.get_session()
+        result = {}
+
+        for _ in range(max_attempts):
+            await self.chat_limiter(chat_id).acquire()
+            await self.global_limiter.acquire()
+
+            started = time.perf_counter()
+            async with session.post(f"{self.base_url}/{method}", json=payload) as response:
+                result = await response.json(content_type=None)
+            METRICS.observe('telegram_send', time.perf_counter() - started, method=method)
+
+            if response.status != 429:
+                return result
+
+            self.throttled += 1
+            METRICS.inc('telegram_throttled')
+            retry_after = result.get('parameters', {}).get('retry_after', 1)
+            print(f"[TelegramQueue] ⏳ Лимит Telegram, ждем {retry_after} с")
+            await asyncio.sleep(retry_after)
+
+        return result
@@ -0,0 +1,71 @@
+import pytest
+
+from apartment import Apartment
+from avito_scraper import AdvancedAvitoScraper
+from browser_pool import BrowserPool
+from config import FILTER_CRITERIA
+from proxy_pool import ProxyPool
+
+SEARCH = {'name': 'test', 'url': 'https://www.avito.ru/moskva/kvartiry/sdam', 'max_pages': 1,
+          'filter': FILTER_CRITERIA}
+
+CARD = """
+<div data-marker="item" data-item-id="1000000001">
+  <a data-marker="item-title" href="/moskva/kvartiry/1000000001"><h3>2-к. квартира, 54 м², 7/22 эт.</h3></a>
+  <span data-marker="item-price"><meta itemprop="price" content="85000"/>85 000 ₽ в месяц</span>
+  <div data-marker="item-address"><span>Ленинский проспект, 12</span>
+    <span>Октябрьская</span><span>7 мин.</span></div>
+  <meta itemprop="description" content="Сдается квартира, евроремонт. Рядом метро Октябрьская."/>
+</div>"""
+
+
+@pytest.fixture
+def scraper(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Файлы cookies пишутся в рабочую папку
+    proxy_pool = ProxyPool([], state_file=None)
+    return AdvancedAvitoScraper(proxy_pool=proxy_pool, browser_pool=BrowserPool(proxy_pool, size=1))
+
+
+def test_http_crawl_returns_apartments_without_browser(scraper, monkeypatch):
+    monkeypatch.setattr(scraper, 'fetch_page', lambda url, proxy=None: f"<html><body>{CARD}</body></html>")
+
+    def no_browser(*args, **kwargs):
+        raise AssertionError("браузер не должен запускаться")
+
+    monkeypatch.setattr(scraper, 'get_apartments_browser', no_browser)
+
+    apartments = scraper.get_apartments_http(SEARCH)
+
+    assert len(apartments) == 1
+    assert all(isinstance(apartment, Apartment) for apartment in apartments)
+    assert apartments[0].id == '1000000001'
+
+
+class FakeDriver:
+    """Драйвер с готовой страницей: считает обращения к page_source"""
+
+    def __init__(self, page_source):
+        self.html = page_source
+        self.current_url = SEARCH['url']
+        self.snapshots = 0
+
+    def get(self, url):
+        pass
+
+    def execute_script(self, script):
+        return True
+
+    @property
+    def page_source(self):
+        self.snapshots += 1
+        return self.html
+
+
+def test_browser_page_with_bot_word_is_not_a_block(scraper):
+    # "bot" в тексте карточки не признак блокировки
+    html = f"<html><body>{CARD.replace('евроремонт', 'евроремонт, рядом Botanical Garden')}</body></html>"
+    scraper.driver = FakeDriver(html)
+    scraper.browser = type('Browser', (), {'proxy': None, 'pages': 0})()
+
+    assert scraper.load_page(SEARCH['url']) == html
+    assert scraper.driver.snapshots == 1
@@ -0,0 +1,52 @@
+import hashlib
+import sqlite3
+
+from apartment import Apartment
+from database import ApartmentDB
+
+URL = 'https://www.avito.ru/moskva/kvartiry/2-k._kvartira_54m_722et._1234567890'
+
+
+def create_legacy_db(path):
+    """База прежней версии: ключ — хеш заголовка, цены и адреса, id Avito не сохранен"""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE apartments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            apartment_id TEXT UNIQUE,
+            avito_id TEXT,
+            title TEXT,
+            price TEXT,
+            price_num INTEGER,
+            location TEXT,
+            url TEXT,
+            image_url TEXT,
+            description TEXT,
+            rooms INTEGER,
+            area REAL,
+            metro_stations TEXT,
+            metro_time INTEGER,
+            date_published TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    legacy_key = hashlib.md5('2-к. квартира, 54 м²85000Ленинский проспект, 12'.encode()).hexdigest()
+    conn.execute('INSERT INTO apartments (apartment_id, avito_id, title, price_num, location, url) VALUES (?, ?, ?, ?, ?, ?)',
+                 (legacy_key, None, '2-к. квартира, 54 м²', 85000, 'Ленинский проспект, 12', URL))
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_rows_are_not_new_after_migration(tmp_path):
+    path = str(tmp_path / 'apartments.db')
+    create_legacy_db(path)
+
+    db = ApartmentDB(path)
+    apartment = Apartment(id='1234567890', title='2-к. квартира, 54 м²', price='85 000 ₽', price_num=85000,
+                          location='Ленинский проспект, 12', url=URL)
+
+    assert db.filter_new([apartment]) == []
+    assert db.conn.execute('SELECT apartment_id, avito_id FROM apartments').fetchone() == (
+        db.generate_apartment_id(apartment), '1234567890'
+    )
+    db.close()
@@ -0,0 +1,32 @@
+import json
+
+from metrics import MetricsRegistry
+
+
+def test_metrics_file_rotates_by_size(tmp_path):
+    filename = str(tmp_path / 'metrics.jsonl')
+    registry = MetricsRegistry()
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('x' * 2048)
+
+    # Файл больше лимита уходит в .1, новая запись начинает свежий файл
+    registry.rotate(filename, max_mb=0.001, backups=2)
+    registry.write_jsonl(filename, sweep=1)
+
+    assert (tmp_path / 'metrics.jsonl.1').read_text(encoding='utf-8') == 'x' * 2048
+    with open(filename, encoding='utf-8') as f:
+        assert [json.loads(line)['sweep'] for line in f] == [1]
+
+
+def test_metrics_file_keeps_only_backups(tmp_path):
+    filename = str(tmp_path / 'metrics.jsonl')
+    registry = MetricsRegistry()
+
+    for sweep in range(5):
+        registry.rotate(filename, max_mb=1e-6, backups=2)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(f'sweep {sweep}')
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['metrics.jsonl', 'metrics.jsonl.1', 'metrics.jsonl.2']
+    assert [(tmp_path / name).read_text() for name in ('metrics.jsonl', 'metrics.jsonl.1', 'metrics.jsonl.2')] == \
+        ['sweep 4', 'sweep 3', 'sweep 2']
@@ -0,0 +1,153 @@
+import asyncio
+import csv
+import json
+import socket
+
+from aiohttp import web
+
+from proxy import ProxyChecker, ResultStream
+
+
+async def start_echo_server():
+    """Целевой сервер проверки: отвечает JSON с адресом клиента, как httpbin.org/ip"""
+    async def handle_ip(request):
+        return web.json_response({'origin': request.remote})
+
+    app = web.Application()
+    app.router.add_get('/ip', handle_ip)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f'http://127.0.0.1:{port}/ip'
+
+
+async def pipe(reader, writer):
+    try:
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def handle_connect(reader, writer):
+    """Минимальный HTTP-прокси: только CONNECT, дальше байты пересылаются как есть"""
+    request_line = await reader.readline()
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+
+    parts = request_line.decode().split()
+    if len(parts) < 2 or parts[0] != 'CONNECT':
+        writer.close()
+        return
+
+    host, port = parts[1].rsplit(':', 1)
+    upstream_reader, upstream_writer = await asyncio.open_connection(host, int(port))
+    writer.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+    await writer.drain()
+    await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+
+
+async def start_proxy_server():
+    server = await asyncio.start_server(handle_connect, '127.0.0.1', 0)
+    return server, f"127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+
+def closed_port_address():
+    """Адрес, на котором никто не слушает (берется после запуска серверов теста, чтобы не совпасть с их портами)"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+
+async def check(proxies, **kwargs):
+    """Проверка списка из 'working' (прокси теста) и 'dead' (закрытый порт)"""
+    runner, target_url = await start_echo_server()
+    server, proxy_address = await start_proxy_server()
+    try:
+        checker = ProxyChecker(target_url=target_url, timeout=2, race_delay=0.1)
+        addresses = [proxy_address if proxy == 'working' else closed_port_address() for proxy in proxies]
+        results = await checker.check_proxy_list_async(addresses, **kwargs)
+        return checker, proxy_address, results
+    finally:
+        server.close()
+        await server.wait_closed()
+        await runner.cleanup()
+
+
+def test_working_proxy():
+    checker, proxy_address, results = asyncio.run(check(['working']))
+
+    assert len(results) == 1
+    result = results[0]
+    assert result['proxy'] == proxy_address
+    assert result['status'] == 'WORKING'
+    assert result['protocol'] == 'HTTP'
+    assert result['ip'] == '127.0.0.1'
+    assert result['response_time'] > 0
+    assert checker.working_proxies == [result]
+    assert checker.failed_proxies == []
+
+
+def test_failing_proxy():
+    checker, proxy_address, results = asyncio.run(check(['dead']))
+
+    assert len(results) == 1
+    assert results[0]['proxy'] != proxy_address
+    assert results[0] == {'proxy': results[0]['proxy'], 'status': 'FAILED', 'protocol': 'None', 'ip': 'None',
+                          'response_time': 0}
+    assert checker.working_proxies == []
+    assert checker.failed_proxies == results
+
+
+def test_results_streamed_to_csv_and_jsonl(tmp_path):
+    csv_file = tmp_path / 'results.csv'
+    jsonl_file = tmp_path / 'results.jsonl'
+
+    _, proxy_address, results = asyncio.run(
+        check(['working', 'dead'], csv_file=str(csv_file), jsonl_file=str(jsonl_file))
+    )
+
+    with open(csv_file, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['proxy'] for row in rows] == [result['proxy'] for result in results]
+    assert sorted((row['proxy'] == proxy_address, row['status']) for row in rows) == [
+        (False, 'FAILED'), (True, 'WORKING')
+    ]
+
+    with open(jsonl_file, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert records == results
+
+
+def test_result_stream_without_files():
+    stream = ResultStream()
+    stream.write({'proxy': '127.0.0.1:1', 'status': 'FAILED', 'protocol': 'None', 'ip': 'None', 'response_time': 0})
+    stream.close()
+    assert stream.files == []
+
+
+def test_iter_results_cleans_up_on_early_exit():
+    async def first_result_then_stop():
+        runner, target_url = await start_echo_server()
+        server, proxy_address = await start_proxy_server()
+        try:
+            checker = ProxyChecker(target_url=target_url, timeout=2, race_delay=0.1)
+            results = checker.iter_results([proxy_address] + [closed_port_address() for _ in range(5)])
+            first = await results.__anext__()
+            await results.aclose()
+            # Все проверки отменены и завершены, висящих задач не осталось
+            pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            return first, pending
+        finally:
+            server.close()
+            await server.wait_closed()
+            await runner.cleanup()
+
+    first, pending = asyncio.run(first_result_then_stop())
+    assert first['status'] in ('WORKING', 'FAILED')
+    assert pending == []